@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: batch raw->plotted conversion vs the per-row reference path.
+
+Builds synthetic upstream tableData pages (see make_rows), checks that
+process_raw_to_plotted and process_raw_to_plotted_rowwise return identical
+rows, and prints timings.
+
+Usage:
+  python bench_convert.py [rows_per_page ...]
+"""
+
+import json
+import random
+import sys
+import time
+
+import servermapv3 as S
+
+DEFAULT_SIZES = [500, 2000, 20000]
+REPEAT = 5
+
+def make_rows(n: int) -> list:
+    """
+    Upstream rows shaped like listarDatosEstructuradosV2 output: readings as
+    decimal strings ("27.0", "4.147") drifting slowly at 3 s sampling, some
+    unit-suffixed or comma-decimal values, null markers, and stretches without
+    a SIM7600G fix that fall back to the station coordinates.
+    """
+    rows = []
+    pm, hum, vbat, lat, lon = 25.0, 40.0, 4.15, -24.754925, -65.395653
+    for i in range(n):
+        pm = max(0.0, pm + random.choice([-1, 0, 0, 1]))
+        hum = min(99.0, max(5.0, hum + random.choice([-0.1, 0, 0.1])))
+        vbat = round(vbat - random.choice([0, 0, 0.001]), 3)
+        moving = (i // 200) % 2 == 1
+        if moving:
+            lat += random.uniform(-2e-5, 2e-5)
+            lon += random.uniform(-2e-5, 2e-5)
+        has_fix = (i // 50) % 10 != 0
+        rows.append({
+            S.KEY_TIME: f"2025-10-16T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}",
+            S.KEY_DEVICE_CODE: "HIRIPRO-01",
+            S.KEY_NUM_ENV: f"{i}.0",
+            S.KEY_PM25: random.choice([f"{pm:.1f}"] * 8 + [f"{pm:.1f} µg/m³", "nan"]),
+            S.KEY_PM1: f"{max(0.0, pm - 8):.1f}",
+            S.KEY_PM10: random.choice([f"{pm + 2:.1f}"] * 9 + [""]),
+            S.KEY_HUM: f"{hum:.1f}",
+            S.KEY_TEMP: random.choice(["28.4", "28,4", "28.5 °C"]),
+            S.KEY_VBAT: f"{vbat:.3f}",
+            S.KEY_SIM_LAT: f"{lat:.6f}" if has_fix else "null",
+            S.KEY_SIM_LON: f"{lon:.6f}" if has_fix else "",
+            S.KEY_SIM_CSQ: "25.0",
+            S.KEY_SIM_SATS: random.choice(["5.0", "6.0", "7.0"]),
+            S.KEY_SIM_SPEED: f"{random.uniform(0, 40):.1f}" if moving else "0.0",
+            S.KEY_META_LAT: "-24.754925",
+            S.KEY_META_LON: "-65.395653",
+        })
+    return rows
+
+def best_of(fn, rows) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or DEFAULT_SIZES
+    random.seed(0)
+    print(f"{'rows':>8} {'rowwise ms':>12} {'batch ms':>10} {'speedup':>8}")
+    for n in sizes:
+        rows = make_rows(n)
+        a = S.process_raw_to_plotted_rowwise(rows)
+        b = S.process_raw_to_plotted(rows)
+        if json.dumps(a) != json.dumps(b):
+            raise SystemExit(f"[ERROR] outputs differ for {n} rows")
+        t_row = best_of(S.process_raw_to_plotted_rowwise, rows)
+        t_vec = best_of(S.process_raw_to_plotted, rows)
+        print(f"{n:>8} {t_row * 1000:>12.2f} {t_vec * 1000:>10.2f} {t_row / t_vec:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -53,10 +53,18 @@
   let clusterLayer = null;    // L.MarkerClusterGroup for clustering
   let heatLayer = null;       // L.heatLayer
   let heatData = [];          // [[lat,lon,val], ...]
+  let heatTiles = null;       // L.tileLayer of server-rendered heat tiles (day mode)
+  let heatTilesDay = null;    // day shown by heatTiles; while set, heatData stays empty
+  let pointTiles = null;      // L.GridLayer of binary point tiles (viewport mode beyond cluster zoom)
+  const pointTileData = new Map(); // 'z/x/y' -> decoded point tile, for click popups
   let lastTs = null;          // last timestamp of current-day load (for Live)
+  let lastSeqs = {};          // device_code -> last seen per-day sequence number (for Live)
   let currentDay = null;      // YYYY-MM-DD currently loaded
   let currentBBox = null;     // for fitBounds after updates
   let useCluster = false;     // toggle clustering based on point count
+  let dayStats = {};          // day -> summary from /api/day-index
+  let viewportMode = false;   // big days: only the visible points are fetched (bbox/zoom)
+  let viewportKey = null;     // day|bbox|zoom of the last viewport query
 
   // Palette helpers
   const BR = CFG.palette.breaks;
@@ -141,34 +149,42 @@
     if(currentBBox){ map.fitBounds(currentBBox, {padding:[20,20]}); }
   }
 
-  function addRows(rows, replace){
-    ensureLayers();
-    if(replace) {
-      clearLayers();
-      totalDataPoints = 0; // reset counter
-      currentBBox = null; // reset bbox
-    }
-    let added = 0;
-    for(const r of rows){
-      const lat = +r.lat, lon = +r.lon, pm25 = +r.pm25;
-      if(!isFinite(lat) || !isFinite(lon) || !isFinite(pm25)) continue;
-      const col = colorForPM(pm25);
-      const popup = `
+  function popupHtml(r){
+    const num = (v, d) => (v != null && isFinite(+v)) ? (+v).toFixed(d) : '-';
+    return `
         <div style="font: 12px system-ui,sans-serif;">
           <b>Dispositivo:</b> ${r.device_code || '-'}<br>
-          <b>PM2.5:</b> ${pm25.toFixed(1)} µg/m³<br>
+          <b>PM2.5:</b> ${num(r.pm25, 1)} µg/m³<br>
           <b>Time:</b> ${r.time || '-'}<br>
           <b>Envíos #:</b> ${r.envio_n || '-'}<br>
-          <b>Lat:</b> ${lat.toFixed(6)}, <b>Lon:</b> ${lon.toFixed(6)}<br>
+          <b>Lat:</b> ${num(r.lat, 6)}, <b>Lon:</b> ${num(r.lon, 6)}<br>
           <hr style="margin:4px 0"/>
           <b>PM1:</b> ${r.pm1 ?? '-'} | <b>PM10:</b> ${r.pm10 ?? '-'}<br>
           <b>Temp PMS:</b> ${r.temp_pms ?? '-'} °C | <b>Hum:</b> ${r.hum ?? '-'} %<br>
           <b>VBat:</b> ${r.vbat ?? '-'} V<br>
           <b>CSQ:</b> ${r.csq ?? '-'} | <b>Sats:</b> ${r.sats ?? '-'} | <b>Speed:</b> ${r.speed_kmh ?? '-'} km/h
         </div>`;
+  }
+
+  // rows: plotted dicts, or a decodeColumnar() result (popups then built on open)
+  function addRows(rows, replace, fit=true){
+    ensureLayers();
+    if(replace) {
+      clearLayers();
+      totalDataPoints = 0; // reset counter
+      currentBBox = null; // reset bbox
+    }
+    const c = rows.columns || null;
+    const n = c ? rows.count : rows.length;
+    let added = 0;
+    for(let i = 0; i < n; i++){
+      const r = c ? null : rows[i];
+      const lat = c ? c.lat[i] : +r.lat, lon = c ? c.lon[i] : +r.lon, pm25 = c ? c.pm25[i] : +r.pm25;
+      if(!isFinite(lat) || !isFinite(lon) || !isFinite(pm25)) continue;
+      const col = colorForPM(pm25);
       const m = L.circleMarker([lat,lon], {
         radius: 6, color: col, fillColor: col, weight: 1, fillOpacity: 0.85
-      }).bindPopup(popup);
+      }).bindPopup(c ? () => popupHtml(columnarRow(rows, i)) : popupHtml(r));
 
       // Add to appropriate layer
       if(useCluster && clusterLayer) {
@@ -176,7 +192,7 @@
       } else {
         pointLayer.addLayer(m);
       }
-      heatData.push([lat,lon, Math.max(BR[0], Math.min(BR[BR.length-1], pm25))]);
+      if(!heatTilesDay) heatData.push([lat,lon, Math.max(BR[0], Math.min(BR[BR.length-1], pm25))]);
       extendBBox(lat, lon);
       added++;
     }
@@ -190,7 +206,7 @@
     }
 
     // Auto-switch clustering based on total point count
-    const shouldCluster = totalDataPoints > 100;
+    const shouldCluster = totalDataPoints > 100 && !viewportMode; // viewport points are thinned server-side
     switchToClusterMode(shouldCluster);
 
     // Update counter display
@@ -200,13 +216,169 @@
     }
 
     // Fit bounds after all markers added
-    if(replace && added > 0) {
+    if(replace && added > 0 && fit) {
       fitIfBounds();
     }
 
     return added;
   }
 
+  // Heat: a day is drawn from server tiles; pages keep the client-side heat layer
+  function showHeatTiles(day){
+    const qp = new URLSearchParams({project_id:$('#project_id').value, device_code:$('#device_code').value, tabla:$('#tabla').value}).toString();
+    const url = `/tiles/heat/${encodeURIComponent(day)}/{z}/{x}/{y}.png?${qp}`;
+    if(!heatTiles){
+      heatTiles = L.tileLayer(url, {maxZoom: CFG.heat_max_zoom, maxNativeZoom: CFG.heat_max_zoom, opacity: 1});
+    }else{
+      heatTiles.setUrl(url);
+    }
+    if(heatLayer && map.hasLayer(heatLayer)) map.removeLayer(heatLayer);
+    if(!map.hasLayer(heatTiles)) heatTiles.addTo(map);
+    heatTilesDay = day;
+  }
+
+  function hideHeatTiles(){
+    if(heatTiles && map.hasLayer(heatTiles)) map.removeLayer(heatTiles);
+    if(heatLayer && !map.hasLayer(heatLayer)) heatLayer.addTo(map);
+    heatTilesDay = null;
+  }
+
+  // Tiles touched by new rows are dropped server-side; redraw revalidates the rest (304)
+  let heatTimer = null;
+  function refreshHeatTiles(){
+    if(!heatTiles || !heatTilesDay) return;
+    clearTimeout(heatTimer);
+    heatTimer = setTimeout(() => heatTiles.redraw(), 1000);
+  }
+
+  // Point tiles: binary /tiles/points (layout in servermapv3.py, BINARY RESPONSES) decoded
+  // into typed arrays and drawn on canvas; popups are fetched on click via /api/point
+  function decodePointTile(buf){
+    const dv = new DataView(buf);
+    if(dv.getUint32(0, true) !== 0x31545048) throw new Error('bad point tile'); // "HPT1"
+    const hlen = dv.getUint32(4, true);
+    const h = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, hlen)));
+    const n = h.count, o = h.offsets;
+    // Typed array views use host byte order; every browser platform is little-endian
+    return {h, n,
+      x: new Uint16Array(buf, o.x, n), y: new Uint16Array(buf, o.y, n),
+      pm25: new Uint16Array(buf, o.pm25, n), seq: new Uint32Array(buf, o.seq, n), dev: new Uint16Array(buf, o.dev, n)};
+  }
+
+  // Tile pixel position of point i (may fall in the margin, i.e. outside 0..256)
+  function pointTileXY(t, i){
+    const m = t.h.margin_px, span = 256 + 2 * m;
+    return [t.x[i] / 65535 * span - m, t.y[i] / 65535 * span - m];
+  }
+
+  function drawPointTile(canvas, t){
+    const ctx = canvas.getContext('2d');
+    ctx.lineWidth = 1;
+    for(let i = 0; i < t.n; i++){
+      if(t.pm25[i] === 0xFFFF) continue; // no PM2.5: not plotted, as in addRows
+      const [px, py] = pointTileXY(t, i);
+      const col = colorForPM(t.pm25[i] / t.h.pm_scale);
+      ctx.beginPath();
+      ctx.arc(px, py, 6, 0, 2 * Math.PI);
+      ctx.globalAlpha = 0.85; ctx.fillStyle = col; ctx.fill();
+      ctx.globalAlpha = 1; ctx.strokeStyle = col; ctx.stroke();
+    }
+  }
+
+  // Returns true when tiles were (re)requested, i.e. nothing stale is on screen
+  function showPointTiles(day){
+    const qp = new URLSearchParams({project_id:$('#project_id').value, device_code:$('#device_code').value, tabla:$('#tabla').value}).toString();
+    const base = `/tiles/points/${encodeURIComponent(day)}`;
+    if(!pointTiles){
+      const PointTileLayer = L.GridLayer.extend({
+        createTile(coords, done){
+          const tile = L.DomUtil.create('canvas');
+          tile.width = tile.height = 256;
+          const k = `${coords.z}/${coords.x}/${coords.y}`;
+          fetch(`${this.options.base}/${k}.bin?${this.options.qp}`)
+            .then(r => { if(!r.ok) throw new Error('HTTP '+r.status); return r.arrayBuffer(); })
+            .then(buf => { const t = decodePointTile(buf); pointTileData.set(k, t); drawPointTile(tile, t); done(null, tile); })
+            .catch(e => done(e, tile));
+          return tile;
+        }
+      });
+      pointTiles = new PointTileLayer({base, qp, minZoom: CFG.cluster_max_zoom + 1, zIndex: 450});
+      pointTiles.on('tileunload', e => pointTileData.delete(`${e.coords.z}/${e.coords.x}/${e.coords.y}`));
+    }else if(pointTiles.options.base !== base || pointTiles.options.qp !== qp){
+      Object.assign(pointTiles.options, {base, qp});
+      if(map.hasLayer(pointTiles)){ pointTiles.redraw(); return true; }
+    }
+    if(map.hasLayer(pointTiles)) return false;
+    pointTiles.addTo(map);
+    return true;
+  }
+
+  function hidePointTiles(){
+    if(pointTiles && map.hasLayer(pointTiles)) map.removeLayer(pointTiles);
+    pointTileData.clear();
+  }
+
+  let pointTimer = null;
+  function refreshPointTiles(){
+    if(!pointTiles || !map.hasLayer(pointTiles)) return;
+    clearTimeout(pointTimer);
+    pointTimer = setTimeout(() => pointTiles.redraw(), 1000);
+  }
+
+  // Nearest point-tile point within 8 px of the click -> popup from /api/point
+  async function onMapClick(e){
+    if(!pointTiles || !map.hasLayer(pointTiles) || !currentDay) return;
+    const z = map.getZoom(), p = map.project(e.latlng, z);
+    const tx = Math.floor(p.x / 256), ty = Math.floor(p.y / 256);
+    const t = pointTileData.get(`${z}/${tx}/${ty}`);
+    if(!t) return;
+    const cx = p.x - tx * 256, cy = p.y - ty * 256;
+    let best = -1, bestD = 64;
+    for(let i = 0; i < t.n; i++){
+      if(t.pm25[i] === 0xFFFF) continue;
+      const [px, py] = pointTileXY(t, i);
+      const d = (px - cx) * (px - cx) + (py - cy) * (py - cy);
+      if(d <= bestD){ best = i; bestD = d; } // later = newer, drawn on top
+    }
+    if(best < 0) return;
+    const qp = new URLSearchParams({project_id:$('#project_id').value, device_code:t.h.devices[t.dev[best]], tabla:$('#tabla').value, day:currentDay, seq:String(t.seq[best])}).toString();
+    try{
+      const j = await fetchJSON('/api/point?'+qp);
+      L.popup().setLatLng([j.row.lat, j.row.lon]).setContent(popupHtml(j.row)).openOn(map);
+    }catch(err){ console.error(err); }
+  }
+
+  // Server-side clusters: one marker per cluster, sized by count, colored by mean PM2.5
+  function addClusters(clusters){
+    ensureLayers();
+    clearLayers();
+    switchToClusterMode(false);
+    let points = 0;
+    for(const c of clusters){
+      const pm = c.pm25_mean ?? 0;
+      const col = colorForPM(pm);
+      const tip = `${c.count} pts · PM2.5 x̄ ${c.pm25_mean != null ? c.pm25_mean.toFixed(1) : '-'} / máx ${c.pm25_max != null ? c.pm25_max.toFixed(1) : '-'}`;
+      let m;
+      if(c.count === 1){
+        m = L.circleMarker([c.lat, c.lon], {radius: 6, color: col, fillColor: col, weight: 1, fillOpacity: 0.85});
+      }else{
+        const size = Math.round(22 + 8 * Math.log10(c.count));
+        m = L.marker([c.lat, c.lon], {icon: L.divIcon({
+          className: '', iconSize: [size, size],
+          html: `<div class="srv-cluster" style="width:${size}px;height:${size}px;background:${col}">${c.count}</div>`
+        })});
+        m.on('click', () => map.setView([c.lat, c.lon], Math.min(map.getZoom() + 2, CFG.cluster_max_zoom + 1)));
+      }
+      pointLayer.addLayer(m.bindTooltip(tip));
+      if(!heatTilesDay) heatData.push([c.lat, c.lon, Math.max(BR[0], Math.min(BR[BR.length-1], pm))]);
+      points += c.count;
+    }
+    if(heatLayer) heatLayer.setLatLngs(heatData);
+    totalDataPoints = points;
+    const counter = $('#dataCount');
+    if(counter) counter.textContent = `${points} puntos en ${clusters.length} grupos`;
+  }
+
   // Fetch helpers
   async function fetchJSON(url){
     const r = await fetch(url, {cache:'no-store'});
@@ -218,14 +390,61 @@
     }
   }
 
+  // /api/data?format=binary (layout in servermapv3.py, BINARY RESPONSES) -> header
+  // fields plus `columns` of typed arrays, without per-row objects
+  const COLUMN_ARRAYS = {f8: Float64Array, f4: Float32Array, i4: Int32Array};
+  async function fetchColumnar(url){
+    const r = await fetch(url, {cache:'no-store'});
+    if(!r.ok){ const j = await r.json().catch(() => ({})); throw new Error(j.error || 'HTTP '+r.status); }
+    const buf = await r.arrayBuffer();
+    const dv = new DataView(buf);
+    if(dv.getUint32(0, true) !== 0x4C4F4348) throw new Error(`Bad columnar data from ${url}`); // "HCOL"
+    const h = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, dv.getUint32(4, true))));
+    h.columns = {};
+    for(const [name, type] of Object.entries(h.types)){
+      h.columns[name] = new COLUMN_ARRAYS[type](buf, h.offsets[name], h.count);
+    }
+    return h;
+  }
+
+  function epochToTime(e){
+    return new Date(e * 1000).toISOString().slice(0, 19);
+  }
+
+  // Python's str(float), as the server formats envio_n in row responses ("660.0")
+  function pyFloatStr(x){
+    return Number.isInteger(x) && Math.abs(x) < 1e16 ? x.toFixed(1) : String(x);
+  }
+
+  // Plotted dict of row i of a columnar response (popups)
+  function columnarRow(j, i){
+    const c = j.columns, v = x => isNaN(x) ? null : x;
+    const text = (j.envio_text || {})[i];
+    const r = {device_code: j.devices[c.device[i]], time: epochToTime(c.epoch[i]),
+               envio_n: text !== undefined ? text : (isNaN(c.envio_n[i]) ? null : pyFloatStr(c.envio_n[i])), seq: c.seq[i]};
+    for(const f of ['lat','lon','pm25','pm1','pm10','temp_pms','hum','vbat','csq','sats','speed_kmh']){
+      r[f] = v(f === 'lat' || f === 'lon' ? c[f][i] : +c[f][i].toPrecision(7)); // float32 -> readable
+    }
+    return r;
+  }
+
   // Day index
   async function refreshDayIndex(selectLatest=true){
     const qp = new URLSearchParams({project_id:$('#project_id').value, device_code:$('#device_code').value, tabla:$('#tabla').value}).toString();
     const j = await fetchJSON('/api/day-index?'+qp);
     const sel = $('#daySelect');
     sel.innerHTML = '';
+    const stats = j.stats || {};
+    dayStats = stats;
     (j.days || []).forEach(d=>{
-      const opt = document.createElement('option'); opt.value = d; opt.textContent = d; sel.appendChild(opt);
+      const opt = document.createElement('option'); opt.value = d; opt.textContent = d;
+      const st = stats[d];
+      if(st){
+        const mean = (st.pm25_mean != null) ? ` · PM2.5 x̄ ${st.pm25_mean.toFixed(1)} / máx ${(st.pm25_max ?? 0).toFixed(1)}` : '';
+        opt.textContent = `${d} (${st.count} pts${mean})`;
+        opt.title = `${st.time_min || '-'} → ${st.time_max || '-'} | envío #${st.last_envio_n ?? '-'}`;
+      }
+      sel.appendChild(opt);
     });
     if(selectLatest && (j.days || []).length){
       sel.value = j.days[j.days.length-1];
@@ -258,6 +477,8 @@
       tabla:$('#tabla').value, limite:String(limit), offset:String(offset), paginate:'0'
     }).toString();
     setStatus('Loading page …'); showSpin(true);
+    hideHeatTiles();
+    hidePointTiles();
     try{
       const j = await fetchJSON('/api/data?'+qp);
       const added = addRows(j.rows||[], replace);
@@ -271,18 +492,89 @@
     }
   }
 
+  function viewportParams(){
+    return {bbox: map.getBounds().toBBoxString(), zoom: String(map.getZoom())};
+  }
+
+  // Replace what is on the map with the current view: server clusters up to
+  // CFG.cluster_max_zoom, the visible points beyond it
+  async function loadViewport(force=false){
+    if(!viewportMode || !currentDay) return null;
+    const vp = viewportParams();
+    const clustered = map.getZoom() <= CFG.cluster_max_zoom;
+    const key = `${currentDay}|${vp.bbox}|${vp.zoom}`;
+    if(!force && key === viewportKey) return null;
+    viewportKey = key;
+    const qp = new URLSearchParams({mode:'day', day:currentDay, project_id:$('#project_id').value, device_code:$('#device_code').value, tabla:$('#tabla').value, ...vp}).toString();
+    // Clusters also give the point count and the live seqs when the points come from tiles
+    const c = await fetchJSON('/api/clusters?'+qp);
+    if(viewportKey !== key) return null; // superseded by a newer pan/zoom
+    if(clustered){
+      hidePointTiles();
+      addClusters(c.clusters || []);
+      setStatus(`Day ${currentDay}: ${c.points ?? 0} points in ${(c.clusters || []).length} clusters`);
+      return c;
+    }
+    clearLayers();
+    totalDataPoints = c.points ?? 0;
+    if(!showPointTiles(currentDay) && force) refreshPointTiles(); // live rows: redraw
+    const counter = $('#dataCount');
+    if(counter) counter.textContent = `${totalDataPoints} puntos en mapa`;
+    setStatus(`Day ${currentDay}: ${totalDataPoints} points in view (point tiles)`);
+    return c;
+  }
+
+  // Live rows in viewport mode: redraw the view (clusters change) instead of adding markers
+  function addLiveRows(rows){
+    refreshHeatTiles();
+    if(!viewportMode) return addRows(rows, false);
+    onMapMoved(true);
+    return rows.length;
+  }
+
+  let moveTimer = null;
+  function onMapMoved(force=false){
+    if(!viewportMode) return;
+    clearTimeout(moveTimer);
+    moveTimer = setTimeout(()=>{ loadViewport(force === true).catch(e => console.error(e)); }, 250);
+  }
+
   async function loadDay(day, replace=true){
     if(!day) return;
+    const st = dayStats[day];
+    viewportMode = !!(st && st.bbox && st.count > CFG.viewport_min_rows);
+    ensureLayers();
+    showHeatTiles(day);
+    if(!viewportMode) hidePointTiles();
+    if(viewportMode){
+      setStatus('Loading day '+day+' (viewport) …'); showSpin(true);
+      try{
+        currentDay = day;
+        updateDayDownloads(day);
+        if(replace){
+          map.fitBounds([[st.bbox[0], st.bbox[1]], [st.bbox[2], st.bbox[3]]], {padding:[20,20], animate:false});
+        }
+        const j = await loadViewport(true);
+        if(j){
+          lastTs = st.time_max;
+          lastSeqs = Object.assign({}, j.seqs || {});
+        }
+      }catch(e){ setStatus('Day load error: '+e.message); console.error(e); }
+      finally{ showSpin(false); }
+      return;
+    }
     const qp = new URLSearchParams({mode:'day', day:day, project_id:$('#project_id').value, device_code:$('#device_code').value, tabla:$('#tabla').value}).toString();
     setStatus('Loading day '+day+' …'); showSpin(true);
     try{
-      const j = await fetchJSON('/api/data?'+qp);
+      const j = await fetchColumnar('/api/data?format=binary&'+qp);
       if(replace) clearLayers();
-      const added = addRows(j.rows||[], replace);
-      lastTs = null; for(const r of (j.rows||[])){ if(r.time && (!lastTs || r.time > lastTs)) lastTs = r.time; }
+      const added = addRows(j, replace);
+      let maxEpoch = -Infinity; for(const e of j.columns.epoch){ if(e > maxEpoch) maxEpoch = e; }
+      lastTs = j.count ? epochToTime(maxEpoch) : null;
+      lastSeqs = Object.assign({}, j.seqs || {});
       currentDay = day;
       updateDayDownloads(day);
-      setStatus(`Day ${day}: rows=${(j.rows||[]).length} added=${added}`);
+      setStatus(`Day ${day}: rows=${j.count} added=${added}`);
     }catch(e){ setStatus('Day load error: '+e.message); console.error(e); }
     finally{ showSpin(false); }
   }
@@ -292,17 +584,58 @@
   const BASE_POLL_INTERVAL = 10000; // 10 segundos base
   const MAX_POLL_INTERVAL = 60000;  // máximo 60 segundos
 
+  function afterSeqParam(){
+    return Object.entries(lastSeqs).map(([dev, seq]) => `${dev}:${seq}`).join(',');
+  }
+
+  function noteSeqs(rows){
+    for(const r of rows){
+      const dev = r.device_code || $('#device_code').value;
+      if(r.seq && (!lastSeqs[dev] || r.seq > lastSeqs[dev])) lastSeqs[dev] = r.seq;
+    }
+  }
+
+  // Keep only rows of the current day that extend each device's seq run.
+  // A hole (missed frame) is reported so the caller can pull the delta instead.
+  function takeNextRows(rows){
+    const byDev = {};
+    for(const r of rows){
+      if(!r.time || r.time.slice(0,10) !== currentDay || !r.seq) continue;
+      const dev = r.device_code || $('#device_code').value;
+      (byDev[dev] = byDev[dev] || []).push(r);
+    }
+    const fresh = [];
+    let gap = false;
+    for(const [dev, list] of Object.entries(byDev)){
+      list.sort((a,b) => a.seq - b.seq);
+      let last = lastSeqs[dev] || 0;
+      for(const r of list){
+        if(r.seq <= last) continue;
+        if(r.seq !== last + 1){ gap = true; break; }
+        fresh.push(r); last = r.seq;
+      }
+      lastSeqs[dev] = last;
+    }
+    return {fresh, gap};
+  }
+
   async function pollLive(){
     if(!$('#chkLive').checked || !currentDay || !lastTs) return;
     try{
-      const qp = new URLSearchParams({
-        mode:'day', day:currentDay, since:lastTs,
+      // Resume exactly after the last row we have; fall back to the lossy time filter
+      const params = {
+        mode:'day', day:currentDay,
         project_id:$('#project_id').value, device_code:$('#device_code').value, tabla:$('#tabla').value
-      }).toString();
-      const j = await fetchJSON('/api/data?'+qp);
-      const rows = j.rows || [];
+      };
+      if(Object.keys(lastSeqs).length){ params.after_seq = afterSeqParam(); } else { params.since = lastTs; }
+      const j = await fetchJSON('/api/data?'+new URLSearchParams(params).toString());
+      if((j.reset || []).length){ await loadDay(currentDay, true); return; }
+      // Rows already delivered over the WebSocket are dropped by seq
+      const rows = (j.rows || []).filter(r => !r.seq || r.seq > (lastSeqs[r.device_code || $('#device_code').value] || 0));
+      noteSeqs(rows);
+      for(const [dev, seq] of Object.entries(j.seqs || {})){ if(!(dev in lastSeqs)) lastSeqs[dev] = seq; }
       if(rows.length){
-        const added = addRows(rows, false);
+        const added = addLiveRows(rows);
         for(const r of rows){ if(r.time && (!lastTs || r.time > lastTs)) lastTs = r.time; }
         setStatus(`Live +${rows.length} (added=${added}) - ${new Date().toLocaleTimeString()}`, wsConnected ? 'connected' : 'polling');
         consecutiveEmptyPolls = 0;
@@ -336,6 +669,16 @@
   let socket = null;
   let wsConnected = false;
 
+  // Server keeps one room per client; subscribing again moves it to the new room
+  function subscribeCurrent(){
+    if(!socket || !wsConnected) return;
+    socket.emit('subscribe', {
+      project_id: $('#project_id').value,
+      device_code: $('#device_code').value,
+      tabla: $('#tabla').value
+    });
+  }
+
   function initWebSocket() {
     if(!window.io) {
       console.warn('Socket.IO not loaded, using polling fallback');
@@ -348,11 +691,7 @@
       console.log('WebSocket connected');
       wsConnected = true;
       setStatus('Conectado en tiempo real', 'connected');
-      socket.emit('subscribe', {
-        project_id: $('#project_id').value,
-        device_code: $('#device_code').value,
-        tabla: $('#tabla').value
-      });
+      subscribeCurrent();
     });
 
     socket.on('disconnect', () => {
@@ -363,14 +702,16 @@
 
     socket.on('new_data', (data) => {
       console.log('Received new data via WebSocket:', data);
-      if(data.rows && data.rows.length > 0 && $('#chkLive').checked) {
-        const added = addRows(data.rows, false);
-        for(const r of data.rows){
-          if(r.time && (!lastTs || r.time > lastTs)) lastTs = r.time;
-        }
-        setStatus(`🟢 WebSocket +${data.count} nuevos - ${new Date().toLocaleTimeString()}`);
-        consecutiveEmptyPolls = 0;
+      if(!(data.count > 0) || !$('#chkLive').checked || !currentDay) return;
+      // Frames carry only new rows tagged with seq; render them directly
+      const {fresh, gap} = takeNextRows(data.rows || []);
+      if(fresh.length){
+        addLiveRows(fresh);
+        for(const r of fresh){ if(r.time && (!lastTs || r.time > lastTs)) lastTs = r.time; }
+        setStatus(`🟢 WebSocket +${fresh.length} nuevos - ${new Date().toLocaleTimeString()}`, 'connected');
       }
+      consecutiveEmptyPolls = 0;
+      if(gap) pollLive();
     });
 
     socket.on('status', (data) => {
@@ -458,12 +799,19 @@
     const box = $('#logs'); show(box, box.style.display === 'none'); if(box.style.display !== 'none') refreshLogs();
   });
 
-  $('#btnApply').addEventListener('click', ()=>{
+  $('#btnApply').addEventListener('click', async ()=>{
     const u = new URL(location.href);
     u.searchParams.set('project_id',$('#project_id').value);
     u.searchParams.set('device_code',$('#device_code').value);
     u.searchParams.set('tabla',$('#tabla').value);
-    location.href = u.toString();
+    if(!(socket && wsConnected)){ location.href = u.toString(); return; }
+    // Switch rooms in place instead of reloading the page
+    history.replaceState(null, '', u.toString());
+    socket.emit('unsubscribe');
+    subscribeCurrent();
+    lastSeqs = {}; lastTs = null;
+    const di = await refreshDayIndex(true);
+    if(di && di.selected){ await loadDay(di.selected, true); } else { clearLayers(); }
   });
 
   $('#btnCollapse').addEventListener('click', ()=>{
@@ -540,6 +888,8 @@
   (async ()=>{
     try{
       await waitForMap();
+      map.on('moveend', onMapMoved);
+      map.on('click', onMapClick);
       setStatus('Map ready.');
       initWebSocket();
       const di = await refreshDayIndex(true);
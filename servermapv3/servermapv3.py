@@ -4,12 +4,19 @@ HIRI map server (V3 - Refactored) with separated HTML/CSS/JS files.
 
 Features
 - /map: interactive Leaflet/Folium map + resizable control panel
-- /api/data: day cache and page data endpoints
-- /api/day-index: list of cached days + collector status
+- /api/data: day cache and page data endpoints (mode=day accepts bbox=/zoom= viewport queries)
+- /tiles/heat/<day>/<z>/<x>/<y>.png: PM2.5 heat tiles rendered with NumPy, cached on disk
+- /tiles/points/<day>/<z>/<x>/<y>.bin: compact binary point tiles; /api/point returns one row (popups)
+- /api/clusters: server-side point clusters of a day for a zoom level and bbox
+- /api/day-index: list of cached days with per-day stats + collector status (incl. adaptive poll interval)
 - /download/<raw|plotted>.<csv|xlsx>: exports current page/day
 - /admin/reindex: start/restart background collector
+- /admin/gaps: missing envio_n ranges per day; repair=1 re-fetches only those upstream pages
 - /admin/purge: purge cache
 - /admin/logs: collector logs
+- /admin/upstream: upstream rate limiter / circuit breaker state, queued and shed requests
+- /admin/worker: collector worker process state (COLLECTOR_PROCESS=True)
+- /admin/cache-stats: day cache memory, LRU hit/miss/eviction counters, upstream client, resolved column schemas
 - /healthz
 
 New in V3:
@@ -21,25 +28,34 @@ New in V3:
 
 import os
 import io
+import asyncio
+import codecs
 import json
 import math
+import multiprocessing
+import queue
 import time
 import shutil
+import struct
 import threading
 import re
 import unicodedata
+import zlib
 
-from collections import deque, defaultdict
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from collections import deque, defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Collection, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
 
+import numpy as np
 import pandas as pd
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 from flask import Flask, request, Response, send_file, redirect, url_for, jsonify, render_template_string
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 
 import folium
 from folium.plugins import Fullscreen, MiniMap, HeatMap
@@ -63,7 +79,54 @@ DEFAULT_RETRIES = 3
 DEFAULT_BACKOFF = 0.5
 
 MAX_PAGES_SAFE = 500
-HEAD_POLL_SECONDS = 30
+STREAM_CHUNK_BYTES = 64 * 1024  # upstream body read size while streaming tableData
+STREAM_BATCH_ROWS = 1000  # raw rows converted at a time while streaming (batch conversion pays off per batch)
+ERROR_BODY_MAX = 64 * 1024  # most bytes read from a non-2xx body
+# "project": one upstream feed per (project, tabla), demultiplexed by codigo_interno
+# into each device's day cache; "device": one feed per device
+COLLECTOR_MODE = "device"
+COLLECTOR_PROCESS = False  # run the collector engine in a separate worker process
+WORKER_STATUS_SECONDS = 2.0  # how often the worker sends collector cursors to the web process
+HEAD_POLL_SECONDS = 30  # initial head poll interval; adapted per device below
+POLL_MIN_SECONDS = 3.0  # fastest head poll (HIRIPRO units transmit every ~3 s)
+POLL_MAX_SECONDS = 900.0  # slowest head poll for silent devices
+POLL_BACKOFF = 2.0  # interval multiplier after a poll with no new rows
+POLL_RATE_ALPHA = 0.3  # EWMA weight of the latest arrival-rate sample
+HEAD_PROBE_ROWS = 10  # first head-sync window; doubles up to the page limit while all rows are new
+COLLECTOR_CONCURRENCY = 8  # upstream requests in flight across all collectors
+UPSTREAM_MAX_CONCURRENCY = 4  # per upstream host, to stay clear of its 429s
+BACKFILL_WORKERS = 4  # concurrent offset ranges per device during backfill
+UPSTREAM_POOL_SIZE = 16  # pooled keep-alive connections to the upstream host
+UPSTREAM_CACHE_TTL = 10.0  # seconds a page-mode/download upstream page is reused
+UPSTREAM_CACHE_MAX = 64  # cached upstream pages
+UPSTREAM_CACHE_MAX_ROWS = 10000  # raw rows held by those pages in total
+# Shared upstream limiter + circuit breaker (all collectors, page mode, downloads)
+UPSTREAM_RATE_PER_S = 5.0  # token-bucket refill rate
+UPSTREAM_BURST = 10  # bucket size
+UPSTREAM_MAX_QUEUE = 64  # waiting requests per priority before new ones are shed
+INTERACTIVE_MAX_WAIT = 10.0  # seconds a browser request may queue before it is shed
+BREAKER_FAILURES = 5  # consecutive upstream failures that open the circuit
+BREAKER_COOLDOWN_S = 30.0  # open -> half-open after this long; one probe decides
+GAP_SCAN_SECONDS = 600.0  # collector: envio_n gap scan + repair pass interval (0 disables)
+GAP_FETCH_SLACK = 20  # rows fetched on each side of a gap's estimated upstream offset
+GAP_MAX_SPAN = 5000  # envio_n jumps larger than this (or backwards) are counter resets, not gaps
+GAP_MAX_PROBES = 4  # re-aimed requests per gap when the offset estimate misses it
+EMIT_COALESCE_SECONDS = 0.5  # merge new_data bursts into one frame per room
+
+# In-memory day cache budget; least-recently-used days are evicted beyond it
+DAY_CACHE_BUDGET_MB = 256
+FP_BYTES_ESTIMATE = 120  # per fingerprint: set slot + "time|envio_n" str
+GRID_CELL_DEG = 0.002  # cell size (~200 m) of the per-day spatial grid index
+GRID_BYTES_ESTIMATE = 40  # per indexed row: int in a cell list
+VIEW_POINT_BUDGET = 5000  # most points one bbox query of /api/data returns
+VIEWPORT_MIN_ROWS = 2000  # the map loads bigger days by viewport instead of whole
+CLUSTER_RADIUS_PX = 60  # cluster cell size in screen pixels at every zoom
+CLUSTER_MAX_ZOOM = 16  # deepest clustered zoom; the map shows points beyond it
+CLUSTER_BYTES_ESTIMATE = 160  # per cluster cell: dict slot + aggregate list
+HEAT_RADIUS_PX = 12  # heat tile kernel radius (Gaussian sigma = radius / 2)
+HEAT_SATURATION = 3.0  # kernel density at which a heat pixel reaches HEAT_MAX_ALPHA
+HEAT_MAX_ALPHA = 0.8
+HEAT_MAX_ZOOM = 18
 
 # Schema
 KEY_TIME = "fecha"
@@ -83,6 +146,7 @@ KEY_SIM_SPEED = "SIM7600G [Velocidad_km/h (km/h)]"
 KEY_META_LAT = "Metadatos Estacion [Latitud (°)]"
 KEY_META_LON = "Metadatos Estacion [Longitud (°)]"
 KEY_NUM_ENV = "Metadatos Estacion [Numero de envios (Numeral)]"
+SCHEMA_CACHE_MAX = 32  # resolved column-set signatures kept
 
 # PM2.5 palette
 PM_BREAKS = [0, 12, 35, 55, 150, 250]
@@ -91,6 +155,8 @@ COLORBAR_CAPTION = "PM2.5 (µg/m³)"
 
 # Storage
 CACHE_ROOT = os.path.abspath("./cache")
+CURSOR_FILE = "cursor.json"
+SIDECAR_SUFFIX = ".idx.json"
 
 # HTTP headers
 DEFAULT_HEADERS = {"User-Agent": "HIRIMap/1.1 (requests)"}
@@ -111,45 +177,145 @@ def log(msg: str) -> None:
     line = f"[{ts}] {msg}"
     print(line, flush=True)
     Logs.append(line)
+    notify_web("log", line)
+
+# Set only inside the collector worker process: its channel back to the web process
+WorkerOutbox: Optional["multiprocessing.Queue"] = None
+
+def notify_web(*msg: Any) -> None:
+    """From the collector worker, post a message to the web process (no-op otherwise)."""
+    if WorkerOutbox is not None:
+        WorkerOutbox.put(msg)
 
 # Per-device structures
 Days: Dict[Tuple[str,str,str], List[str]] = defaultdict(list)
-DayRows: Dict[Tuple[str,str,str], Dict[str, List[Dict[str,Any]]]] = defaultdict(lambda: defaultdict(list))
+DayRows: Dict[Tuple[str,str,str], Dict[str, "DayColumns"]] = defaultdict(dict)
 DayFP: Dict[Tuple[str,str,str], Dict[str, set]] = defaultdict(lambda: defaultdict(set))
 Cursor: Dict[Tuple[str,str,str], Dict[str, Any]] = defaultdict(dict)
-CollectorThreads: Dict[Tuple[str,str,str], Dict[str, Any]] = {}
+CollectorTasks: Dict[Tuple[str,str,str], Dict[str, Any]] = {}  # touched only on the engine loop
+
+# WebSocket sid -> the single room it is subscribed to
+Subscriptions: Dict[str, str] = {}
+
+# room -> [(key, rows)] waiting for the next coalesced 'new_data' frame
+PendingEmits: Dict[str, List[Tuple[Tuple[str,str,str], List[Dict[str,Any]]]]] = defaultdict(list)
+EmitLock = threading.Lock()
+EmitFlusherStarted = False
+
+# Global change counter: total rows ever appended through add_to_day_cache
+ChangeSeq = 0
+
+# Day catalog: per-day summaries mirrored in <day>.idx.json sidecars
+DayIndex: Dict[Tuple[str,str,str], Dict[str, Dict[str,Any]]] = defaultdict(dict)
+CatalogScanned: set = set()
+
+# LRU order of loaded (key, day) -> approx bytes, plus hit/miss/eviction counters
+DayLRU: "OrderedDict[Tuple[Tuple[str,str,str], str], int]" = OrderedDict()
+CacheStats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
+
+# Guards DayRows/DayFP/Days/DayLRU against concurrent collectors and request handlers
+CacheLock = threading.RLock()
+
+# Upstream column-set signature -> resolved RowSchema
+SchemaCache: "OrderedDict[frozenset, RowSchema]" = OrderedDict()
+SchemaStats: Dict[str, int] = {"hits": 0, "misses": 0}
+SchemaLock = threading.Lock()  # resolve_schema runs on executor threads
 
 # =========================
 # ====== UTILITIES ========
 # =========================
 
-def make_session(retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF) -> requests.Session:
+def make_session(retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_maxsize=10) -> requests.Session:
+    """Pooled session; retries=0 makes exactly one request per call (no status/read retries)."""
     s = requests.Session()
     r = Retry(
         total=int(retries), connect=int(retries), read=int(retries), status=int(retries),
         backoff_factor=float(backoff),
-        status_forcelist=[429,500,502,503,504],
+        status_forcelist=[429,500,502,503,504] if retries else [],
         allowed_methods={"GET"},
         raise_on_status=False
     )
-    a = HTTPAdapter(max_retries=r)
+    a = HTTPAdapter(max_retries=r, pool_connections=int(pool_maxsize), pool_maxsize=int(pool_maxsize))
     s.mount("https://", a); s.mount("http://", a)
     s.headers.update(DEFAULT_HEADERS)
     return s
 
+UNIT_TOKENS = ["µg/m³","ug/m3","km/h","V","%","°C"]
+NULL_TOKENS = {"nan","null","none"}
+PLAIN_CHARS = "0123456789.-"
+
 def to_float(x: Any) -> Optional[float]:
     if x is None: return None
     try:
         if isinstance(x, (int,float)):
             return float(x) if not (isinstance(x,float) and math.isnan(x)) else None
         s = str(x).strip().replace(",", ".")
-        if s == "" or s.lower() in {"nan","null","none"}: return None
-        for tok in ["µg/m³","ug/m3","km/h","V","%","°C"]:
+        if s == "" or s.lower() in NULL_TOKENS: return None
+        for tok in UNIT_TOKENS:
             s = s.replace(tok,"").strip()
         return float(s)
     except Exception:
         return None
 
+def to_float_column(values: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    to_float over a whole column. Returns (float64 values, present mask); entries
+    where to_float gives None are NaN with present=False.
+    The column is factorized (hashed in C) so each distinct string reading is
+    converted once: sensor columns repeat a small set of values at 3 s sampling.
+    Distinct bare decimals are cast in one go; anything with units, commas or
+    null markers goes through to_float. Non-string entries are cast per entry,
+    since hashing would merge 0.0/-0.0 and 1/True.
+    """
+    n = len(values)
+    out = np.full(n, np.nan)
+    present = np.zeros(n, dtype=bool)
+    if n == 0:
+        return out, present
+    col = np.fromiter(values, dtype=object, count=n)
+    try:
+        codes, uniques = pd.factorize(col)
+    except TypeError:  # unhashable cells (lists, dicts)
+        for i, x in enumerate(values):
+            f = to_float(x)
+            if f is not None:
+                out[i] = f
+                present[i] = True
+        return out, present
+
+    m = len(uniques)
+    ustr = np.fromiter((isinstance(u, str) for u in uniques), dtype=bool, count=m)
+    uvals = np.full(m, np.nan)
+    uok = np.zeros(m, dtype=bool)
+    if ustr.any():
+        sidx = np.flatnonzero(ustr)
+        su = uniques[sidx]
+        # Bare decimals ("27.0", "-24.754925") parse with one C-level float() cast;
+        # the length check rejects strings NumPy would truncate (trailing NULs).
+        u = su.astype(str)
+        ulen = np.fromiter(map(len, su), dtype=np.int64, count=len(su))
+        plain = (ulen > 0) & (np.char.str_len(u) == ulen) & (np.char.str_len(np.char.strip(u, PLAIN_CHARS)) == 0)
+        try:
+            uvals[sidx[plain]] = u[plain].astype(np.float64)
+            uok[sidx[plain]] = True
+        except ValueError:
+            plain[:] = False
+        for j in sidx[~plain].tolist():
+            f = to_float(uniques[j])
+            if f is not None:
+                uvals[j] = f
+                uok[j] = True
+
+    hit = codes >= 0
+    out[hit] = uvals[codes[hit]]
+    present[hit] = uok[codes[hit]]
+    if not ustr.all():
+        for i in np.flatnonzero(hit & ~ustr[np.maximum(codes, 0)]).tolist():
+            f = to_float(values[i])
+            out[i] = np.nan if f is None else f
+            present[i] = f is not None
+    return out, present
+
 def choose_coords(row: Dict[str,Any]) -> Tuple[Optional[float], Optional[float]]:
     lat = to_float(row.get(KEY_SIM_LAT)); lon = to_float(row.get(KEY_SIM_LON))
     if lat is not None and lon is not None: return lat, lon
@@ -175,11 +341,461 @@ def is_no_records_payload(payload: dict) -> bool:
     msg = (payload.get("error") or payload.get("message") or "").lower()
     return "no hay registros" in msg
 
+# ---- Schema mapping ----
+
+# field -> (canonical upstream header, fallback needle groups tried in order)
+SCHEMA_FIELDS: Dict[str, Tuple[str, List[Tuple[str, ...]]]] = {
+    "time":      (KEY_TIME,        [("fecha",), ("time",)]),
+    "device":    (KEY_DEVICE_CODE, [("codigo interno",), ("device",)]),
+    "envio":     (KEY_NUM_ENV,     [("numero", "envios"), ("envios",), ("envio",)]),
+    "pm25":      (KEY_PM25,        [("pm 2 5",), ("pm2 5",), ("pm25",)]),
+    "pm1":       (KEY_PM1,         [("pm 1 0",), ("pm 1",), ("pm1",)]),
+    "pm10":      (KEY_PM10,        [("pm 10",), ("pm10",)]),
+    "hum":       (KEY_HUM,         [("humedad",), ("hum",)]),
+    "temp":      (KEY_TEMP,        [("pms5003", "grados"), ("pms5003", "temperatura"), ("temperatura",), ("grados", "celcius"), ("temp",)]),
+    "vbat":      (KEY_VBAT,        [("voltaje",), ("vbat",), ("bateria",)]),
+    "sim_lat":   (KEY_SIM_LAT,     [("sim7600g", "latitud"), ("sim7600", "latitud"), ("sim", "lat")]),
+    "sim_lon":   (KEY_SIM_LON,     [("sim7600g", "longitud"), ("sim7600", "longitud"), ("sim", "lon")]),
+    "sim_csq":   (KEY_SIM_CSQ,     [("intensidad", "senal"), ("csq",)]),
+    "sim_sats":  (KEY_SIM_SATS,    [("satelites",), ("sats",)]),
+    "sim_speed": (KEY_SIM_SPEED,   [("velocidad",), ("km h",)]),
+    "meta_lat":  (KEY_META_LAT,    [("metadatos", "latitud"), ("estacion", "latitud"), ("meta", "lat")]),
+    "meta_lon":  (KEY_META_LON,    [("metadatos", "longitud"), ("estacion", "longitud"), ("meta", "lon")]),
+}
+
+def _norm(s: str) -> str:
+    """Normalize header names: lowercase, remove accents, µ->u, keep alnum words."""
+    s = unicodedata.normalize("NFKD", str(s))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.lower().replace("µ", "u").replace("°", "")
+    return re.sub(r"[^a-z0-9]+", " ", s).strip()
+
+def _find_key(normed: Dict[str, str], *needles: str) -> Optional[str]:
+    """Column whose normalized words contain every needle; shortest header wins."""
+    hits = [c for c, n in normed.items() if all(f" {nd} " in f" {n} " for nd in needles)]
+    return min(hits, key=lambda c: (len(normed[c]), c)) if hits else None
+
+class RowSchema:
+    """
+    Field -> upstream header mapping for one column-set signature, resolved once
+    and reused for every page with the same columns. Canonical KEY_* headers win;
+    otherwise the header is matched by normalized words (renamed sensors).
+    """
+    def __init__(self, columns: frozenset):
+        self.n_columns = len(columns)
+        self.keys: Dict[str, Optional[str]] = {}
+        self.fuzzy: Dict[str, str] = {}
+        self.hits = 0
+        normed = {c: _norm(c) for c in columns if isinstance(c, str)}
+        for field, (canonical, groups) in SCHEMA_FIELDS.items():
+            if canonical in columns:
+                self.keys[field] = canonical
+                continue
+            found = None
+            for needles in groups:
+                found = _find_key(normed, *needles)
+                if found:
+                    break
+            self.keys[field] = found
+            if found:
+                self.fuzzy[field] = found
+
+    @property
+    def missing(self) -> List[str]:
+        return [f for f, k in self.keys.items() if k is None]
+
+    def column(self, rows: List[Dict[str,Any]], field: str) -> List[Any]:
+        k = self.keys[field]
+        if k is None:
+            return [None] * len(rows)
+        return [r.get(k) for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"columns": self.n_columns, "hits": self.hits, "fuzzy": self.fuzzy, "missing": self.missing}
+
+def resolve_schema(raw_rows: List[Dict[str,Any]]) -> RowSchema:
+    """
+    RowSchema for the columns of raw_rows, from SchemaCache when seen before.
+    Upstream pages are uniform, so the signature is the first row's keys; the
+    full union is only taken when the key counts (checked in C) or the keys of
+    the middle and last rows disagree with it.
+    """
+    if not raw_rows:
+        sig = frozenset()
+    else:
+        sig = frozenset(raw_rows[0])
+        if (len(set(map(len, raw_rows))) != 1
+                or not sig.issuperset(raw_rows[len(raw_rows) // 2]) or not sig.issuperset(raw_rows[-1])):
+            sig = frozenset().union(*raw_rows)
+    with SchemaLock:
+        schema = SchemaCache.get(sig)
+        new = schema is None
+        if not new:
+            SchemaStats["hits"] += 1
+            SchemaCache.move_to_end(sig)
+        else:
+            SchemaStats["misses"] += 1
+            schema = RowSchema(sig)
+            SchemaCache[sig] = schema
+            while len(SchemaCache) > SCHEMA_CACHE_MAX:
+                SchemaCache.popitem(last=False)
+        schema.hits += 1
+    if new and (schema.fuzzy or schema.missing):
+        log(f"[schema] new signature ({schema.n_columns} cols) fuzzy={schema.fuzzy} missing={schema.missing}")
+    return schema
+
+# =========================
+# ====== DAY STORE ========
+# =========================
+
+# Numeric plotted fields, stored as float64 columns (NaN = missing)
+NUM_FIELDS = ("lat", "lon", "pm25", "pm1", "pm10", "temp_pms", "hum", "vbat", "csq", "sats", "speed_kmh")
+
+_EPOCH = datetime(1970, 1, 1)
+
+def time_to_epoch(ts: Any) -> Optional[float]:
+    """Parse a row 'time' (ISO wall-clock, as sent by the device) to epoch seconds."""
+    if not ts: return None
+    try:
+        dt = datetime.fromisoformat(str(ts).replace("Z", ""))
+    except ValueError:
+        return None
+    return (dt.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+def epoch_to_time(e: float) -> str:
+    return (_EPOCH + timedelta(seconds=e)).isoformat()
+
+def unix_to_epoch(ts: float) -> float:
+    """Real unix seconds -> the naive wall-clock epoch of time_to_epoch, read in the
+    server's local time zone (rows carry the devices' local wall-clock time)."""
+    return (datetime.fromtimestamp(ts) - _EPOCH).total_seconds()
+
+class InternTable:
+    """Maps repeated scalar values (device codes) to int32 ids. Entries are never freed,
+    so only low-cardinality fields belong here."""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self.ids: Dict[Tuple[type, Any], int] = {}
+        self.lock = threading.Lock()
+
+    def intern(self, v: Any) -> int:
+        if v is None: return -1
+        k = (type(v), v if isinstance(v, (str, int, float)) else json.dumps(v, ensure_ascii=False))
+        i = self.ids.get(k)
+        if i is None:
+            with self.lock:
+                i = self.ids.get(k)
+                if i is None:
+                    i = len(self.values)
+                    self.values.append(v)
+                    self.ids[k] = i
+        return i
+
+    def lookup(self, i: int) -> Any:
+        return None if i < 0 else self.values[i]
+
+Interned = InternTable()
+
+MERCATOR_MAX_LAT = 85.05112878
+
+def mercator_xy(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Web Mercator position in [0, 1) world units (x east, y south), as map tiles use."""
+    phi = np.radians(np.clip(lat, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / math.pi) / 2.0
+    return x, y
+
+def mercator_latlon(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * y))))
+    return lat, x * 360.0 - 180.0
+
+class ClusterIndex:
+    """
+    Hierarchical clusters of one day's rows: for every zoom 0..CLUSTER_MAX_ZOOM a
+    Web Mercator grid of CLUSTER_RADIUS_PX-pixel cells (each level nests into the
+    one above), cell -> [count, sum x, sum y, sum pm25, n pm25, max pm25].
+    Appends only add to the cells their rows fall in.
+    """
+
+    def __init__(self, radius_px: int = CLUSTER_RADIUS_PX, max_zoom: int = CLUSTER_MAX_ZOOM):
+        self.radius = float(radius_px)
+        self.max_zoom = int(max_zoom)
+        self.levels: List[Dict[int, List[float]]] = [{} for _ in range(self.max_zoom + 1)]
+
+    def add(self, lat: np.ndarray, lon: np.ndarray, pm25: np.ndarray) -> None:
+        ok = np.isfinite(lat) & np.isfinite(lon)
+        if not ok.any():
+            return
+        x, y = mercator_xy(lat[ok], lon[ok])
+        pm = pm25[ok]
+        has_pm = np.isfinite(pm)
+        pm0 = np.where(has_pm, pm, 0.0)
+        pm_max = np.where(has_pm, pm, -np.inf)
+        for z, cells in enumerate(self.levels):
+            scale = 256.0 * (1 << z) / self.radius
+            keys = (np.floor(x * scale).astype(np.int64) << 32) | np.floor(y * scale).astype(np.int64)
+            uniq, inv = np.unique(keys, return_inverse=True)
+            m = len(uniq)
+            agg = np.stack([np.bincount(inv, minlength=m).astype(np.float64),
+                            np.bincount(inv, x, m), np.bincount(inv, y, m),
+                            np.bincount(inv, pm0, m), np.bincount(inv, has_pm, m)], axis=1)
+            mx = np.full(m, -np.inf)
+            np.maximum.at(mx, inv, pm_max)
+            for key, a, b in zip(uniq.tolist(), agg.tolist(), mx.tolist()):
+                c = cells.get(key)
+                if c is None:
+                    cells[key] = a + [b]
+                else:
+                    for i in range(5):
+                        c[i] += a[i]
+                    if b > c[5]:
+                        c[5] = b
+
+    def level(self, zoom: int) -> Dict[int, List[float]]:
+        return self.levels[max(0, min(int(zoom), self.max_zoom))]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(cells) for cells in self.levels) * CLUSTER_BYTES_ESTIMATE
+
+def query_clusters(indexes: List[ClusterIndex], zoom: int,
+                   bbox: Optional[Tuple[float, float, float, float]] = None) -> List[Dict[str,Any]]:
+    """
+    Clusters at `zoom` with their centroid inside bbox=(south, west, north, east),
+    merged across devices (same cell key = same cluster). Largest first.
+    """
+    merged: Dict[int, List[float]] = {}
+    for ix in indexes:
+        for key, c in ix.level(zoom).items():
+            m = merged.get(key)
+            if m is None:
+                merged[key] = list(c)
+            else:
+                for i in range(5):
+                    m[i] += c[i]
+                m[5] = max(m[5], c[5])
+    if not merged:
+        return []
+    agg = np.array(list(merged.values()), dtype=np.float64)
+    n = agg[:, 0]
+    lat, lon = mercator_latlon(agg[:, 1] / n, agg[:, 2] / n)
+    keep = np.ones(len(agg), dtype=bool)
+    if bbox is not None:
+        south, west, north, east = bbox
+        keep = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+    order = np.flatnonzero(keep)[np.argsort(-n[keep], kind="stable")]
+    out = []
+    for i in order.tolist():
+        c = agg[i]
+        out.append({"lat": float(lat[i]), "lon": float(lon[i]), "count": int(c[0]),
+                    "pm25_mean": float(c[3] / c[4]) if c[4] else None,
+                    "pm25_max": float(c[5]) if c[4] else None})
+    return out
+
+class GridIndex:
+    """
+    Uniform lat/lon grid over one day's rows: cell -> seqs of the rows in it.
+    Seqs are stable under DayColumns' time-ordered inserts (positions are not)
+    and map back to positions through DayColumns.seq_pos.
+    """
+
+    def __init__(self, cell_deg: float = GRID_CELL_DEG):
+        self.cell = float(cell_deg)
+        self.cells: Dict[Tuple[int,int], List[int]] = defaultdict(list)
+        self.n = 0
+
+    def add(self, seqs: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> None:
+        ok = np.isfinite(lat) & np.isfinite(lon)
+        ci = np.floor(lat[ok] / self.cell).astype(np.int64).tolist()
+        cj = np.floor(lon[ok] / self.cell).astype(np.int64).tolist()
+        for i, j, sq in zip(ci, cj, seqs[ok].tolist()):
+            self.cells[(i, j)].append(sq)
+        self.n += len(ci)
+
+    def query(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Seqs of rows in the cells overlapping the box (a superset of the rows inside it)."""
+        i0, i1 = math.floor(south / self.cell), math.floor(north / self.cell)
+        j0, j1 = math.floor(west / self.cell), math.floor(east / self.cell)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) <= len(self.cells):
+            hits = [self.cells.get((i, j)) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+        else:
+            hits = [v for (i, j), v in self.cells.items() if i0 <= i <= i1 and j0 <= j <= j1]
+        seqs = [sq for h in hits if h for sq in h]
+        return np.array(seqs, dtype=np.int64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.n * GRID_BYTES_ESTIMATE
+
+class DayColumns:
+    """
+    Rows of one (device, day) kept as typed NumPy columns instead of dicts,
+    ordered by time. Arrays grow geometrically; only the first `n` slots are valid.
+    Dicts are rebuilt on demand by `to_dicts` when a response is serialized.
+
+    Every row gets a sequence number (1..n) in arrival order, which matches its
+    line order in the day's .jsonl, so numbers survive eviction and restarts.
+    `seq_pos[s-1]` is the current (time-ordered) position of row `s`.
+    `grid` indexes rows by location for viewport queries (bbox_index);
+    `clusters` (built on first use by cluster_index) holds per-zoom clusters.
+
+    envio_n is unique per row, so it is a float64 column (NaN when absent), not
+    interned. Upstream sends it as "123.0", which str(float) reproduces; any other
+    original value is kept in `envio_text` (by seq) so responses return it as sent.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.n = 0
+        self.epoch = np.empty(capacity, dtype=np.float64)
+        self.device = np.empty(capacity, dtype=np.int32)
+        self.envio = np.empty(capacity, dtype=np.float64)
+        self.envio_text: Dict[int, Any] = {}
+        self.num = {f: np.empty(capacity, dtype=np.float64) for f in NUM_FIELDS}
+        self.seq = np.empty(capacity, dtype=np.int64)
+        self.seq_pos = np.empty(capacity, dtype=np.int64)
+        self.grid = GridIndex()
+        self.clusters: Optional[ClusterIndex] = None
+        self.file_pos = 0  # bytes of the day's .jsonl read into these columns
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _columns(self) -> List[Tuple[str, np.ndarray]]:
+        cols = [("epoch", self.epoch), ("device", self.device), ("envio", self.envio), ("seq", self.seq)]
+        return cols + [(f, a) for f, a in self.num.items()]
+
+    def _set_column(self, name: str, arr: np.ndarray) -> None:
+        if name in self.num:
+            self.num[name] = arr
+        else:
+            setattr(self, name, arr)
+
+    def _reserve(self, extra: int) -> None:
+        need = self.n + extra
+        cap = len(self.epoch)
+        if need <= cap: return
+        while cap < need:
+            cap *= 2
+        for name, a in self._columns() + [("seq_pos", self.seq_pos)]:
+            b = np.empty(cap, dtype=a.dtype)
+            b[:self.n] = a[:self.n]
+            self._set_column(name, b)
+
+    @property
+    def nbytes(self) -> int:
+        return (sum(a.nbytes for _, a in self._columns()) + self.seq_pos.nbytes + self.grid.nbytes
+                + len(self.envio_text) * FP_BYTES_ESTIMATE
+                + (self.clusters.nbytes if self.clusters is not None else 0))
+
+    @property
+    def last_seq(self) -> int:
+        return self.n
+
+    def append(self, rows: List[Dict[str,Any]]) -> int:
+        """
+        Insert plotted dicts keeping rows ordered by time; rows with an unparseable
+        time are dropped. Newer-than-everything batches (head polls) are a plain
+        append; older ones (backfill pages, newest-first) are merged in O(n + k).
+        """
+        epochs = [time_to_epoch(r.get("time")) for r in rows]
+        keep = [r for r, e in zip(rows, epochs) if e is not None]
+        k = len(keep)
+        if k == 0: return 0
+        new = {"epoch": np.array([e for e in epochs if e is not None], dtype=np.float64),
+               "device": np.array([Interned.intern(r.get("device_code")) for r in keep], dtype=np.int32)}
+        envio = [r.get("envio_n") for r in keep]
+        new["envio"], _ = to_float_column(envio)
+        for j, (v, x) in enumerate(zip(envio, new["envio"].tolist())):
+            if v is not None and not (isinstance(v, str) and str(x) == v):
+                self.envio_text[self.n + 1 + j] = v
+        for f in NUM_FIELDS:
+            vals = [to_float(r.get(f)) for r in keep]
+            new[f] = np.array([np.nan if v is None else v for v in vals], dtype=np.float64)
+        new["seq"] = np.arange(self.n + 1, self.n + k + 1, dtype=np.int64)
+
+        order = np.argsort(new["epoch"], kind="stable")
+        if not np.all(order[:-1] < order[1:]):
+            new = {name: a[order] for name, a in new.items()}
+
+        n = self.n
+        self._reserve(k)
+        if n == 0 or new["epoch"][0] >= self.epoch[n - 1]:
+            for name, a in self._columns():
+                a[n:n + k] = new[name]
+            final = np.arange(n, n + k)
+        else:
+            pos = np.searchsorted(self.epoch[:n], new["epoch"], side="right")
+            for name, a in self._columns():
+                a[:n + k] = np.insert(a[:n], pos, new[name])
+            # Existing rows shift right by the number of rows inserted at or before them
+            self.seq_pos[:n] += np.searchsorted(pos, self.seq_pos[:n], side="right")
+            final = pos + np.arange(k)
+        self.seq_pos[new["seq"] - 1] = final
+        self.n = n + k
+        self.grid.add(new["seq"], new["lat"], new["lon"])
+        if self.clusters is not None:
+            self.clusters.add(new["lat"], new["lon"], new["pm25"])
+        return k
+
+    def cluster_index(self) -> ClusterIndex:
+        """The day's ClusterIndex, built from all rows the first time it is asked for."""
+        if self.clusters is None:
+            self.clusters = ClusterIndex()
+            self.clusters.add(self.num["lat"][:self.n], self.num["lon"][:self.n], self.num["pm25"][:self.n])
+        return self.clusters
+
+    def tail_index(self, after_epoch: float) -> np.ndarray:
+        """Indices of rows strictly newer than `after_epoch` (binary search)."""
+        i = int(np.searchsorted(self.epoch[:self.n], after_epoch, side="right"))
+        return np.arange(i, self.n)
+
+    def after_seq_index(self, after_seq: int) -> np.ndarray:
+        """Positions of rows with seq > `after_seq`, in arrival order. O(delta)."""
+        return self.seq_pos[max(0, int(after_seq)):self.n].copy()
+
+    def bbox_index(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Time-ordered positions of rows inside the box, via the grid."""
+        seqs = self.grid.query(south, west, north, east)
+        if not len(seqs):
+            return seqs
+        pos = np.sort(self.seq_pos[seqs - 1])
+        lat, lon = self.num["lat"][pos], self.num["lon"][pos]
+        return pos[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)]
+
+    def to_dicts(self, idx: Optional[np.ndarray] = None, default_device: Optional[str] = None) -> List[Dict[str,Any]]:
+        """Materialize plotted dicts for `idx` (all rows if None), in that order."""
+        sel = slice(0, self.n) if idx is None else idx
+        ep = self.epoch[sel].tolist()
+        dev = self.device[sel].tolist()
+        env = self.envio[sel].tolist()
+        seq = self.seq[sel].tolist()
+        nums = [(f, self.num[f][sel].tolist()) for f in NUM_FIELDS]
+        out = []
+        for i in range(len(ep)):
+            dc = Interned.lookup(dev[i])
+            en = env[i]
+            r = {
+                "device_code": dc if dc is not None else default_device,
+                "time": epoch_to_time(ep[i]),
+                "envio_n": self.envio_text.get(seq[i], None if en != en else str(en)),
+                "seq": seq[i],
+            }
+            for f, col in nums:
+                v = col[i]
+                r[f] = None if v != v else v
+            out.append(r)
+        return out
+
 # ---- Cache helpers ----
 
 def key_tuple(project_id: str, device_code: str, tabla: str) -> Tuple[str,str,str]:
     return (str(project_id), str(device_code), str(tabla))
 
+def safe_path_part(v: str) -> bool:
+    """Whether a request value can be used inside a cache file name (no separators, no dot prefix)."""
+    return not any(c in v for c in "/\\\0") and not v.startswith(".")
+
 def cache_dir(key: Tuple[str,str,str]) -> str:
     p, d, t = key
     path = os.path.join(CACHE_ROOT, f"{p}_{d}_{t}")
@@ -193,85 +809,500 @@ def day_from_time(ts: str) -> Optional[str]:
     except Exception:
         return None
 
+def stored_day(r: Dict[str,Any]) -> Optional[str]:
+    """Day a plotted row is stored under, or None if its time does not parse: DayColumns
+    cannot place such a row, so it stays out of the files, fingerprints and summaries too."""
+    ts = r.get("time")
+    return day_from_time(ts) if time_to_epoch(ts) is not None else None
+
+def default_cursor() -> Dict[str,Any]:
+    # head_mark: time|envio_n of the newest raw upstream rows seen by head_sync, converted or not
+    return {"offset": 0, "pages": 0, "finished": False, "last_ok_ts": None, "last_error": None, "last_url": "",
+            "head_mark": []}
+
+def atomic_write_json(path: str, obj: Any) -> None:
+    """Write JSON to a temp file, fsync, then rename over `path` so a crash never leaves a torn file."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def cursor_path(key: Tuple[str,str,str]) -> str:
+    return os.path.join(cache_dir(key), CURSOR_FILE)
+
+def load_cursor(key: Tuple[str,str,str]) -> Dict[str,Any]:
+    """Load the persisted collector checkpoint for `key` (defaults if missing/corrupt)."""
+    cur = default_cursor()
+    path = cursor_path(key)
+    if not os.path.isfile(path):
+        return cur
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if isinstance(saved, dict):
+            cur.update({k: saved[k] for k in cur if k in saved})
+            cur["resumed_from"] = saved.get("saved_at")
+    except Exception as e:
+        log(f"[cursor] ignoring unreadable checkpoint {path}: {e}")
+    return cur
+
+def save_cursor(key: Tuple[str,str,str]) -> None:
+    cur = Cursor.get(key)
+    if cur is None:
+        return
+    data = {k: cur.get(k) for k in default_cursor()}
+    data["saved_at"] = time.time()
+    try:
+        atomic_write_json(cursor_path(key), data)
+    except OSError as e:
+        log(f"[cursor] could not save checkpoint for {key}: {e}")
+
 def ensure_structs(key: Tuple[str,str,str]) -> None:
     _ = cache_dir(key)
     if key not in Cursor:
-        Cursor[key] = {"offset": 0, "pages": 0, "finished": False, "last_ok_ts": None, "last_error": None, "last_url": ""}
-
-def load_day_from_disk(key: Tuple[str,str,str], day: str) -> None:
-    ensure_structs(key)
-    if day in DayRows[key]:
-        return
+        Cursor[key] = load_cursor(key)
+
+def row_fingerprint(r: Dict[str,Any]) -> str:
+    return f"{r.get('time','')}|{r.get('envio_n','')}"
+
+# ---- Day summaries (sidecar index) ----
+
+def sidecar_path(key: Tuple[str,str,str], day: str) -> str:
+    return os.path.join(cache_dir(key), f"{day}{SIDECAR_SUFFIX}")
+
+def empty_day_summary() -> Dict[str,Any]:
+    return {"count": 0, "time_min": None, "time_max": None, "bbox": None,
+            "pm25_min": None, "pm25_max": None, "pm25_mean": None, "pm25_sum": 0.0, "pm25_n": 0,
+            "last_envio_n": None, "file_size": 0}
+
+def update_day_summary(summary: Dict[str,Any], rows: List[Dict[str,Any]]) -> None:
+    """Fold plotted rows into a day summary (count, time range, bbox, PM2.5 stats)."""
+    s = summary
+    for r in rows:
+        s["count"] += 1
+        ts = r.get("time")
+        if ts:
+            if s["time_min"] is None or ts < s["time_min"]:
+                s["time_min"] = ts
+            if s["time_max"] is None or ts >= s["time_max"]:
+                s["time_max"] = ts
+                s["last_envio_n"] = r.get("envio_n")
+        lat, lon = to_float(r.get("lat")), to_float(r.get("lon"))
+        if lat is not None and lon is not None:
+            b = s["bbox"]
+            s["bbox"] = [lat, lon, lat, lon] if b is None else [min(b[0], lat), min(b[1], lon), max(b[2], lat), max(b[3], lon)]
+        pm = to_float(r.get("pm25"))
+        if pm is not None:
+            s["pm25_min"] = pm if s["pm25_min"] is None else min(s["pm25_min"], pm)
+            s["pm25_max"] = pm if s["pm25_max"] is None else max(s["pm25_max"], pm)
+            s["pm25_sum"] += pm
+            s["pm25_n"] += 1
+    s["pm25_mean"] = (s["pm25_sum"] / s["pm25_n"]) if s["pm25_n"] else None
+
+def build_day_summary(key: Tuple[str,str,str], day: str) -> Dict[str,Any]:
+    """Recompute a day summary by streaming its .jsonl (does not load the day into memory)."""
     path = os.path.join(cache_dir(key), f"{day}.jsonl")
-    rows, fps = [], set()
-    if os.path.isfile(path):
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    r = json.loads(line)
-                    fp = f"{r.get('time','')}|{r.get('envio_n','')}"
-                    if fp in fps:
-                        continue
-                    fps.add(fp)
-                    rows.append(r)
-                except Exception:
-                    continue
-    DayRows[key][day] = rows
-    DayFP[key][day] = fps
-    if day not in Days[key]:
-        Days[key].append(day)
-        Days[key] = sorted(Days[key])
+    summary = empty_day_summary()
+    if not os.path.isfile(path):
+        return summary
+    fps = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except Exception:
+                continue
+            fp = row_fingerprint(r)
+            if fp in fps or stored_day(r) is None:
+                continue
+            fps.add(fp)
+            update_day_summary(summary, [r])
+    summary["file_size"] = os.path.getsize(path)
+    return summary
 
-def add_to_day_cache(key: Tuple[str,str,str], plotted: List[Dict[str,Any]]) -> Dict[str,int]:
-    ensure_structs(key)
-    added_per_day: Dict[str,int] = defaultdict(int)
+def day_summary(key: Tuple[str,str,str], day: str) -> Dict[str,Any]:
+    """
+    Catalog entry for a day: memory first, then sidecar (if not stale), else rebuild.
+    A day without a .jsonl gets a fresh empty summary that is neither cached nor
+    saved, so asking about a day never adds it to the catalog.
+    """
+    with CacheLock:
+        s = DayIndex[key].get(day)
+        if s is not None:
+            return s
+        path = os.path.join(cache_dir(key), f"{day}.jsonl")
+        if not os.path.isfile(path):
+            return empty_day_summary()
+        size = os.path.getsize(path)
+        try:
+            with open(sidecar_path(key, day), "r", encoding="utf-8") as f:
+                s = json.load(f)
+            if s.get("file_size") != size:
+                s = None
+        except (OSError, ValueError):
+            s = None
+        if s is None:
+            s = build_day_summary(key, day)
+            if not COLLECTOR_PROCESS:  # in worker mode the worker owns the sidecars
+                save_day_summary(key, day, s)
+        DayIndex[key][day] = s
+        return s
+
+def save_day_summary(key: Tuple[str,str,str], day: str, summary: Dict[str,Any]) -> None:
+    if not os.path.isfile(os.path.join(cache_dir(key), f"{day}.jsonl")):
+        return  # no sidecar without its data file
+    try:
+        atomic_write_json(sidecar_path(key, day), summary)
+    except OSError as e:
+        log(f"[index] could not write sidecar for {key} {day}: {e}")
+
+def public_summary(summary: Dict[str,Any]) -> Dict[str,Any]:
+    out = {k: v for k, v in summary.items() if k not in ("pm25_sum", "pm25_n", "gaps")}
+    g = summary.get("gaps")
+    if g is not None:
+        out["gaps"] = {"missing": g["missing"], "pending": g["pending"],
+                       "ranges": len(g["ranges"]), "resets": g["resets"]}
+    return out
 
-    for r in plotted:
-        d = day_from_time(r.get("time"))
-        if not d:
+def merge_summaries(summaries: List[Dict[str,Any]]) -> Dict[str,Any]:
+    """Combine per-device summaries of the same day (all-devices view)."""
+    m = empty_day_summary()
+    for s in summaries:
+        m["count"] += s["count"]
+        m["file_size"] += s["file_size"]
+        m["pm25_sum"] += s["pm25_sum"]
+        m["pm25_n"] += s["pm25_n"]
+        for k, fn in (("time_min", min), ("pm25_min", min), ("pm25_max", max)):
+            if s[k] is not None:
+                m[k] = s[k] if m[k] is None else fn(m[k], s[k])
+        if s["time_max"] is not None and (m["time_max"] is None or s["time_max"] >= m["time_max"]):
+            m["time_max"] = s["time_max"]
+            m["last_envio_n"] = s["last_envio_n"]
+        if s["bbox"] is not None:
+            b = m["bbox"] or s["bbox"]
+            m["bbox"] = [min(b[0], s["bbox"][0]), min(b[1], s["bbox"][1]), max(b[2], s["bbox"][2]), max(b[3], s["bbox"][3])]
+        if s.get("gaps") is not None:
+            g = m.setdefault("gaps", {"missing": 0, "pending": 0, "ranges": [], "resets": 0})
+            for k in ("missing", "pending", "ranges", "resets"):
+                g[k] += s["gaps"][k]
+    m["pm25_mean"] = (m["pm25_sum"] / m["pm25_n"]) if m["pm25_n"] else None
+    return m
+
+def catalog_devices(project_id: str, tabla: str) -> List[str]:
+    """Devices of (project, tabla) with at least one cached day."""
+    ensure_catalog(project_id, tabla)
+    with CacheLock:
+        return sorted(k[1] for k, days in DayIndex.items()
+                      if k[0] == str(project_id) and k[2] == str(tabla) and k[1] and days)
+
+def ensure_catalog(project_id: str, tabla: str) -> None:
+    if (str(project_id), str(tabla)) not in CatalogScanned:
+        scan_and_load_all_devices(project_id, tabla)
+
+# ---- Day memory (LRU) ----
+
+def day_nbytes(key: Tuple[str,str,str], day: str) -> int:
+    """Approximate resident size of one loaded day (columns + fingerprint set)."""
+    cols = DayRows[key].get(day)
+    return (cols.nbytes if cols is not None else 0) + len(DayFP[key].get(day, ())) * FP_BYTES_ESTIMATE
+
+def touch_day(key: Tuple[str,str,str], day: str) -> None:
+    DayLRU[(key, day)] = day_nbytes(key, day)
+    DayLRU.move_to_end((key, day))
+
+def evict_days(keep: Optional[Tuple[Tuple[str,str,str], str]] = None) -> None:
+    """Drop least-recently-used days (rows + fingerprints) until under the budget."""
+    budget = int(DAY_CACHE_BUDGET_MB * 1024 * 1024)
+    used = sum(DayLRU.values())
+    for lk in list(DayLRU.keys()):
+        if used <= budget:
+            break
+        if lk == keep:
+            continue
+        nb = DayLRU.pop(lk)
+        k, d = lk
+        DayRows[k].pop(d, None)
+        DayFP[k].pop(d, None)
+        used -= nb
+        CacheStats["evictions"] += 1
+        CacheStats["evicted_bytes"] += nb
+
+def forget_days(key: Tuple[str,str,str]) -> None:
+    for lk in [lk for lk in DayLRU if lk[0] == key]:
+        DayLRU.pop(lk, None)
+
+def read_day_lines(path: str, start: int = 0) -> Tuple[List[Dict[str,Any]], int]:
+    """
+    Rows of a day .jsonl from byte `start` up to its last complete line, and the
+    offset just past that line. A line still being appended (by the worker) is
+    left for the next read, which starts at the returned offset.
+    """
+    if not os.path.isfile(path):
+        return [], start
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    rows = []
+    for line in data[:end].splitlines():
+        try:
+            rows.append(json.loads(line))
+        except Exception:
             continue
-        load_day_from_disk(key, d)
-        fp = f"{r.get('time','')}|{r.get('envio_n','')}"
-        if fp in DayFP[key][d]:
+    return rows, start + end
+
+def unseen_rows(rows: List[Dict[str,Any]], fps: set) -> List[Dict[str,Any]]:
+    """Rows whose fingerprint is not in `fps` yet (added to it), minus unstorable ones."""
+    out = []
+    for r in rows:
+        fp = row_fingerprint(r)
+        if fp in fps or stored_day(r) is None:
             continue
-        DayFP[key][d].add(fp)
-        DayRows[key][d].append(r)
-        added_per_day[d] += 1
-
-    for d, n in added_per_day.items():
-        if n <= 0: continue
-        path = os.path.join(cache_dir(key), f"{d}.jsonl")
-        with open(path, "a", encoding="utf-8") as f:
-            for r in DayRows[key][d][-n:]:
-                f.write(json.dumps(r, ensure_ascii=False) + "\n")
-
-    if added_per_day:
-        Days[key] = sorted(set(Days[key]) | set(added_per_day.keys()))
+        fps.add(fp)
+        out.append(r)
+    return out
+
+def load_day_from_disk(key: Tuple[str,str,str], day: str) -> None:
+    ensure_structs(key)
+    with CacheLock:
+        if day in DayRows[key]:
+            CacheStats["hits"] += 1
+            DayLRU.move_to_end((key, day))
+            return
+        CacheStats["misses"] += 1
+        path = os.path.join(cache_dir(key), f"{day}.jsonl")
+        fps = set()
+        lines, end = read_day_lines(path)
+        rows = unseen_rows(lines, fps)
+        cols = DayColumns(capacity=max(64, len(rows)))
+        cols.append(rows)
+        cols.file_pos = end
+        DayRows[key][day] = cols
+        DayFP[key][day] = fps
+        if day not in Days[key] and os.path.isfile(path):
+            Days[key].append(day)
+            Days[key] = sorted(Days[key])
+        touch_day(key, day)
+        evict_days(keep=(key, day))
+
+def add_to_day_cache(key: Tuple[str,str,str], plotted: List[Dict[str,Any]],
+                     collect: Optional[List[Dict[str,Any]]] = None) -> Dict[str,int]:
+    """
+    Dedupe and append plotted rows to their days (memory + .jsonl + sidecar).
+    Returns {day: rows added}. If `collect` is given, the stored rows are appended
+    to it as served by /api/data (with their `seq`).
+    """
+    global ChangeSeq
+    ensure_structs(key)
+    by_day: Dict[str, List[Dict[str,Any]]] = defaultdict(list)
+    for r in plotted:
+        d = stored_day(r)
+        if d:
+            by_day[d].append(r)
+
+    added_per_day: Dict[str,int] = {}
+    with CacheLock:
+        for d, day_rows in by_day.items():
+            load_day_from_disk(key, d)
+            fps = DayFP[key][d]
+            new_rows = []
+            for r in day_rows:
+                fp = row_fingerprint(r)
+                if fp in fps:
+                    continue
+                fps.add(fp)
+                new_rows.append(r)
+            if not new_rows:
+                continue
+            summary = day_summary(key, d)
+            cols = DayRows[key][d]
+            before = cols.last_seq
+            cols.append(new_rows)
+            if collect is not None:
+                collect.extend(cols.to_dicts(cols.after_seq_index(before), default_device=key[1]))
+            path = os.path.join(cache_dir(key), f"{d}.jsonl")
+            with open(path, "a", encoding="utf-8") as f:
+                for r in new_rows:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            invalidate_heat_tiles(key, d, new_rows)
+            update_day_summary(summary, new_rows)
+            summary["file_size"] = cols.file_pos = os.path.getsize(path)
+            save_day_summary(key, d, summary)
+            DayIndex[key][d] = summary
+            touch_day(key, d)
+            added_per_day[d] = len(new_rows)
+
+        if added_per_day:
+            ChangeSeq += sum(added_per_day.values())
+            Days[key] = sorted(set(Days[key]) | set(added_per_day.keys()))
+            evict_days()
     return added_per_day
 
-def process_raw_to_plotted(raw_rows: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
+# ---- envio_n gaps ----
+#
+# envio_n is the device's transmission counter, so within a device a jump from
+# a to b (1 < b - a <= GAP_MAX_SPAN, in time order) means rows a+1..b-1 are
+# missing. Each day's scan is kept in its summary under "gaps" (and so in the
+# sidecar) together with the row count it saw; a day is only rescanned after
+# its count changes, or the previous day's last row does.
+
+def envio_column(cols: DayColumns, idx: Optional[np.ndarray] = None) -> np.ndarray:
+    """envio_n of a loaded day (rows `idx`, else all in time order) as float64, NaN where absent."""
+    return cols.envio[:cols.n] if idx is None else cols.envio[idx]
+
+def scan_day_gaps(key: Tuple[str,str,str], day: str, prev: Optional[List[float]] = None,
+                  save: bool = True) -> Dict[str,Any]:
+    """
+    Missing envio_n ranges of one day. `prev` is [envio_n, epoch] of the newest row
+    of the previous cached day, so a hole across midnight is found too.
+    Ranges are [first missing, last missing, epoch before, epoch after].
+    """
+    with CacheLock:
+        summary = day_summary(key, day)
+        old = summary.get("gaps")
+        if old is not None and old["count"] == summary["count"] and old["prev"] == prev:
+            return old
+        load_day_from_disk(key, day)
+        cols = DayRows[key][day]
+        env = envio_column(cols)
+        ok = ~np.isnan(env)
+        e, t = env[ok], cols.epoch[:cols.n][ok]
+    if prev is not None and len(e):
+        e = np.concatenate(([prev[0]], e))
+        t = np.concatenate(([prev[1]], t))
+    step = np.diff(e)
+    hole = np.flatnonzero((step > 1) & (step <= GAP_MAX_SPAN))
+    ranges = [[int(e[i]) + 1, int(e[i + 1]) - 1, float(t[i]), float(t[i + 1])] for i in hole]
+    kept = {(lo, hi) for lo, hi in (old or {}).get("unrecoverable", [])}
+    unrecoverable = [[r[0], r[1]] for r in ranges if (r[0], r[1]) in kept]
+    missing = sum(r[1] - r[0] + 1 for r in ranges)
+    g = {
+        "count": summary["count"],
+        "prev": prev,
+        "last": [float(e[-1]), float(t[-1])] if len(e) else prev,
+        "ranges": ranges,
+        "missing": missing,
+        "pending": missing - sum(hi - lo + 1 for lo, hi in unrecoverable),
+        "unrecoverable": unrecoverable,
+        "resets": int(np.count_nonzero((step < 0) | (step > GAP_MAX_SPAN))),
+    }
+    with CacheLock:
+        summary["gaps"] = g
+        if save:
+            save_day_summary(key, day, summary)
+    return g
+
+def scan_gaps(key: Tuple[str,str,str], save: bool = True) -> Dict[str, Dict[str,Any]]:
+    """Scan every cached day of a device in order (unchanged days are skipped)."""
+    out: Dict[str, Dict[str,Any]] = {}
+    prev = None
+    with CacheLock:
+        days = [d for d in Days.get(key, ())
+                if d in DayIndex[key] or os.path.isfile(os.path.join(cache_dir(key), f"{d}.jsonl"))]
+    for day in days:
+        out[day] = scan_day_gaps(key, day, prev, save)
+        prev = out[day]["last"]
+    return out
+
+def mark_unrecoverable(key: Tuple[str,str,str], day: str, ranges: List[List[int]], save: bool = True) -> None:
+    """Remember ranges a repair could not fill (absent upstream or dropped by conversion)."""
+    with CacheLock:
+        summary = day_summary(key, day)
+        g = summary.get("gaps")
+        if g is None:
+            return
+        have = {(lo, hi) for lo, hi in g["unrecoverable"]}
+        for lo, hi in ranges:
+            if (lo, hi) not in have:
+                g["unrecoverable"].append([lo, hi])
+                g["pending"] -= hi - lo + 1
+        if save:
+            save_day_summary(key, day, summary)
+
+def rows_newer_than(key: Tuple[str,str,str], epoch: float) -> int:
+    """Cached rows of a device strictly newer than `epoch`: its upstream offset if nothing were missing."""
+    day = epoch_to_time(epoch)[:10]
+    with CacheLock:
+        n = sum(day_summary(key, d)["count"] for d in Days.get(key, ()) if d > day)
+        if day in Days.get(key, ()):
+            load_day_from_disk(key, day)
+            cols = DayRows[key][day]
+            n += cols.n - int(np.searchsorted(cols.epoch[:cols.n], epoch, side="right"))
+    return n
+
+PLOTTED_FLOAT_FIELDS = [
+    ("pm1", "pm1"), ("pm10", "pm10"), ("temp_pms", "temp"), ("hum", "hum"),
+    ("vbat", "vbat"), ("csq", "sim_csq"), ("sats", "sim_sats"), ("speed_kmh", "sim_speed"),
+]
+
+def process_raw_to_plotted_rowwise(raw_rows: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
+    """Per-row reference conversion; process_raw_to_plotted must match it exactly."""
+    if not raw_rows:
+        return []
+    k = resolve_schema(raw_rows).keys
     out = []
     for row in raw_rows:
-        lat, lon = choose_coords(row)
-        pm25 = to_float(row.get(KEY_PM25))
+        lat = to_float(row.get(k["sim_lat"])); lon = to_float(row.get(k["sim_lon"]))
+        if lat is None or lon is None:
+            lat = to_float(row.get(k["meta_lat"])); lon = to_float(row.get(k["meta_lon"]))
+        pm25 = to_float(row.get(k["pm25"]))
         if lat is None or lon is None or pm25 is None:
             continue
-        out.append({
-            "device_code": row.get(KEY_DEVICE_CODE),
-            "time": row.get(KEY_TIME),
-            "envio_n": row.get(KEY_NUM_ENV),
+        rec = {
+            "device_code": row.get(k["device"]),
+            "time": row.get(k["time"]),
+            "envio_n": row.get(k["envio"]),
             "lat": lat, "lon": lon, "pm25": pm25,
-            "pm1": to_float(row.get(KEY_PM1)),
-            "pm10": to_float(row.get(KEY_PM10)),
-            "temp_pms": to_float(row.get(KEY_TEMP)),
-            "hum": to_float(row.get(KEY_HUM)),
-            "vbat": to_float(row.get(KEY_VBAT)),
-            "csq": to_float(row.get(KEY_SIM_CSQ)),
-            "sats": to_float(row.get(KEY_SIM_SATS)),
-            "speed_kmh": to_float(row.get(KEY_SIM_SPEED)),
-        })
+        }
+        for name, field in PLOTTED_FLOAT_FIELDS:
+            rec[name] = to_float(row.get(k[field]))
+        out.append(rec)
     return out
 
+def process_raw_to_plotted(raw_rows: List[Dict[str,Any]],
+                           schema: Optional[RowSchema] = None) -> List[Dict[str,Any]]:
+    """
+    Batch conversion of an upstream tableData page: resolve the column schema
+    once (or take the page's, if the caller already resolved it), one
+    to_float_column pass per field, SIM7600G coordinates with station fallback,
+    then rows without lat/lon/PM2.5 dropped.
+    Same output as process_raw_to_plotted_rowwise.
+    """
+    if not raw_rows:
+        return []
+    schema = schema or resolve_schema(raw_rows)
+    lat, lat_ok = to_float_column(schema.column(raw_rows, "sim_lat"))
+    lon, lon_ok = to_float_column(schema.column(raw_rows, "sim_lon"))
+    sim = lat_ok & lon_ok
+    if not sim.all():
+        fb = np.flatnonzero(~sim)
+        sub = [raw_rows[i] for i in fb]
+        mlat, mlat_ok = to_float_column(schema.column(sub, "meta_lat"))
+        mlon, mlon_ok = to_float_column(schema.column(sub, "meta_lon"))
+        lat[fb], lat_ok[fb] = mlat, mlat_ok
+        lon[fb], lon_ok[fb] = mlon, mlon_ok
+    pm25, pm25_ok = to_float_column(schema.column(raw_rows, "pm25"))
+
+    keep = np.flatnonzero(lat_ok & lon_ok & pm25_ok)
+    if not len(keep):
+        return []
+    rows = [raw_rows[i] for i in keep]
+    floats = []
+    for _, field in PLOTTED_FLOAT_FIELDS:
+        v, ok = to_float_column(schema.column(rows, field))
+        floats.append(np.where(ok, v.astype(object), None).tolist())
+    return [
+        {"device_code": dc, "time": tm, "envio_n": en, "lat": la, "lon": lo, "pm25": pm,
+         "pm1": p1, "pm10": p10, "temp_pms": tp, "hum": hu, "vbat": vb,
+         "csq": cs, "sats": sa, "speed_kmh": sp}
+        for dc, tm, en, la, lo, pm, p1, p10, tp, hu, vb, cs, sa, sp in zip(
+            schema.column(rows, "device"), schema.column(rows, "time"),
+            schema.column(rows, "envio"), lat[keep].tolist(), lon[keep].tolist(),
+            pm25[keep].tolist(), *floats)
+    ]
+
 # =========================
 # ===== CSV MAP GENERATOR =
 # =========================
@@ -386,145 +1417,1291 @@ def generate_html_map_from_csv_data(plotted_records: List[Dict[str, Any]], title
 
     return fmap.get_root().render()
 
+# =========================
+# ====== HEAT TILES =======
+# =========================
+#
+# 256 px Web Mercator tiles of PM2.5: kernel density of the points (count and
+# PM2.5-weighted), colored by the density-weighted mean PM2.5 on the PM_BREAKS /
+# PM_COLORS steps, opacity from the density. Tiles are cached as PNG under
+# CACHE_ROOT/_tiles/heat/<project>_<tabla>/<device or _all>/<day>/z/x/y.png;
+# appends delete only the cached tiles within HEAT_RADIUS_PX of the new rows.
+
+HeatStats: Dict[str, int] = {"rendered": 0, "hits": 0, "invalidated": 0}
+
+def heat_tile_dir(project_id: str, tabla: str, devset: str, day: Optional[str] = None) -> str:
+    base = os.path.join(CACHE_ROOT, "_tiles", "heat", f"{project_id}_{tabla}", devset or "_all")
+    path = os.path.join(base, day) if day else base
+    root = os.path.realpath(os.path.join(CACHE_ROOT, "_tiles", "heat"))
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise ValueError(f"heat tile path outside the cache: {path}")
+    return path
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Minimal PNG writer (8-bit RGBA, no filtering) for an (h, w, 4) uint8 array."""
+    h, w, _ = rgba.shape
+    raw = np.zeros((h, w * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(h, w * 4)
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+EMPTY_TILE_PNG = encode_png(np.zeros((256, 256, 4), dtype=np.uint8))
+
+def tile_bounds(z: int, x: int, y: int, margin_px: float = 0.0) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile, grown by margin_px screen pixels."""
+    size = 256.0 * (1 << z)
+    x0, x1 = (x * 256 - margin_px) / size, ((x + 1) * 256 + margin_px) / size
+    y0, y1 = (y * 256 - margin_px) / size, ((y + 1) * 256 + margin_px) / size
+    north, west = mercator_latlon(np.float64(x0), np.float64(max(y0, 0.0)))
+    south, east = mercator_latlon(np.float64(x1), np.float64(min(y1, 1.0)))
+    return float(south), float(west), float(north), float(east)
+
+def gaussian_matrix(radius: int) -> np.ndarray:
+    """(256, 256 + 2r) matrix K such that K @ G @ K.T blurs a grid with an r-pixel margin."""
+    sigma = max(radius / 2.0, 0.5)
+    d = np.arange(256)[:, None] + radius - np.arange(256 + 2 * radius)[None, :]
+    return np.exp(-(d * d) / (2 * sigma * sigma))
+
+HeatKernel = gaussian_matrix(HEAT_RADIUS_PX)
+
+def render_heat_tile(lat: np.ndarray, lon: np.ndarray, pm25: np.ndarray, z: int, x: int, y: int) -> bytes:
+    ok = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(pm25)
+    if not ok.any():
+        return EMPTY_TILE_PNG
+    r = HEAT_RADIUS_PX
+    mx, my = mercator_xy(lat[ok], lon[ok])
+    size = 256.0 * (1 << z)
+    px = np.floor(mx * size - x * 256).astype(np.int64) + r
+    py = np.floor(my * size - y * 256).astype(np.int64) + r
+    span = 256 + 2 * r
+    inside = (px >= 0) & (px < span) & (py >= 0) & (py < span)
+    if not inside.any():
+        return EMPTY_TILE_PNG
+    cell = py[inside] * span + px[inside]
+    count = np.bincount(cell, minlength=span * span).reshape(span, span).astype(np.float64)
+    pm_sum = np.bincount(cell, pm25[ok][inside], minlength=span * span).reshape(span, span)
+    k = HeatKernel
+    density = k @ count @ k.T
+    value = (k @ pm_sum @ k.T) / np.maximum(density, 1e-12)
+    alpha = np.clip(density / HEAT_SATURATION, 0.0, 1.0) ** 0.5 * HEAT_MAX_ALPHA
+    alpha[density < 1e-3] = 0.0
+    palette = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in PM_COLORS], dtype=np.uint8)
+    step = np.clip(np.searchsorted(PM_BREAKS, value, side="right") - 1, 0, len(PM_COLORS) - 1)
+    rgba = np.empty((256, 256, 4), dtype=np.uint8)
+    rgba[..., :3] = palette[step]
+    rgba[..., 3] = np.round(alpha * 255).astype(np.uint8)
+    return encode_png(rgba)
+
+def invalidate_heat_tiles(key: Tuple[str,str,str], day: str, rows: List[Dict[str,Any]]) -> None:
+    """Delete cached heat tiles (device and all-devices sets) that `rows` draw into, at every cached zoom."""
+    p, dev, t = key
+    dirs = [heat_tile_dir(p, t, devset, day) for devset in (dev, "")]
+    dirs = [d for d in dirs if os.path.isdir(d)]
+    if not dirs or not rows:
+        return
+    lat = np.array([to_float(r.get("lat")) for r in rows], dtype=np.float64)
+    lon = np.array([to_float(r.get("lon")) for r in rows], dtype=np.float64)
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    if not ok.any():
+        return
+    mx, my = mercator_xy(lat[ok], lon[ok])
+    for base in dirs:
+        for zname in os.listdir(base):
+            if not zname.isdigit():
+                continue
+            z = int(zname)
+            size = 256.0 * (1 << z)
+            tiles = set()
+            for dx in (-HEAT_RADIUS_PX, HEAT_RADIUS_PX):
+                for dy in (-HEAT_RADIUS_PX, HEAT_RADIUS_PX):
+                    tx = np.floor((mx * size + dx) / 256).astype(np.int64)
+                    ty = np.floor((my * size + dy) / 256).astype(np.int64)
+                    tiles.update(zip(tx.tolist(), ty.tolist()))
+            for tx, ty in tiles:
+                try:
+                    os.remove(os.path.join(base, zname, str(tx), f"{ty}.png"))
+                    HeatStats["invalidated"] += 1
+                except OSError:
+                    pass
+
+def heat_tile_png(project_id: str, device_code: str, tabla: str, day: str,
+                  z: int, x: int, y: int) -> Tuple[Optional[str], bytes]:
+    """
+    (cache path, PNG) of one heat tile, rendering it on a miss. The path is None
+    when rows were appended while rendering: that tile is served but not cached.
+    """
+    path = os.path.join(heat_tile_dir(project_id, tabla, device_code, day), str(z), str(x), f"{y}.png")
+    if os.path.isfile(path):
+        HeatStats["hits"] += 1
+        return path, b""
+    devices = catalog_devices(project_id, tabla) if not device_code else [device_code]
+    bounds = tile_bounds(z, x, y, HEAT_RADIUS_PX)
+    lat, lon, pm, versions = [], [], [], []
+    with CacheLock:
+        for device in devices:
+            dkey = key_tuple(project_id, device, tabla)
+            load_day_from_disk(dkey, day)
+            cols = DayRows[dkey].get(day)
+            if cols is None or len(cols) == 0:
+                continue
+            idx = cols.bbox_index(*bounds)
+            lat.append(cols.num["lat"][idx])
+            lon.append(cols.num["lon"][idx])
+            pm.append(cols.num["pm25"][idx])
+            versions.append((dkey, cols.last_seq))
+    png = (render_heat_tile(np.concatenate(lat), np.concatenate(lon), np.concatenate(pm), z, x, y)
+           if lat else EMPTY_TILE_PNG)
+    HeatStats["rendered"] += 1
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with CacheLock:
+        if not all(DayRows[k].get(day) is not None and DayRows[k][day].last_seq == v for k, v in versions):
+            return None, png
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, path)
+    return path, png
+
+# =========================
+# ===== BINARY RESPONSES ==
+# =========================
+#
+# Both formats are little-endian:
+#   magic | uint32 header length | JSON header (space-padded) | arrays
+# Each array starts on a multiple of its alignment so the browser can view it
+# as a typed array in place; header "offsets" gives its byte offset and
+# header "count" its length.
+
+def pack_arrays(magic: bytes, header: Dict[str,Any], arrays: List[Tuple[str, np.ndarray]],
+                align: int = 8) -> bytes:
+    """Frame `arrays` (already little-endian) behind `magic` and a JSON header."""
+    # Offsets depend on the header length, which depends on the offsets: size the header first
+    hlen = len(json.dumps({**header, "offsets": {name: 10 ** 12 for name, _ in arrays}}))
+    hlen += (-(8 + hlen)) % align
+    offsets, chunks, o = {}, [], 8 + hlen
+    for name, a in arrays:
+        pad = (-o) % align
+        chunks += [b"\0" * pad, a.tobytes()]
+        offsets[name] = o + pad
+        o += pad + a.nbytes
+    hjson = json.dumps({**header, "offsets": offsets}).encode("utf-8").ljust(hlen, b" ")
+    return b"".join([magic, struct.pack("<I", hlen), hjson] + chunks)
+
+# ---- Point tiles ----
+# b"HPT1", arrays aligned to 4: x uint16, y uint16, pm25 uint16, seq uint32, dev uint16.
+# x/y are the point's pixel offset from the tile's top-left corner plus margin_px,
+# quantized to 1/65535 of 256 + 2*margin_px (points just outside the tile are
+# included, so markers are not cut at tile edges). pm25 is PM2.5 * pm_scale
+# (0xFFFF = none). dev indexes header "devices" and, with seq, identifies the row
+# for /api/point. About 13 bytes per point.
+
+POINT_TILE_MAGIC = b"HPT1"
+POINT_PM_SCALE = 10  # pm25 resolution 0.1 µg/m³
+POINT_TILE_MARGIN_PX = 8  # ≥ marker radius drawn by the client
+
+def encode_point_tile(parts: List[Tuple[str, "DayColumns", np.ndarray]], z: int, x: int, y: int) -> bytes:
+    size = 256.0 * (1 << z)
+    m = POINT_TILE_MARGIN_PX
+    span = 256.0 + 2 * m
+    xs, ys, pms, seqs, devs = [], [], [], [], []
+    for i, (dev, cols, idx) in enumerate(parts):
+        mx, my = mercator_xy(cols.num["lat"][idx], cols.num["lon"][idx])
+        xs.append(np.clip(np.round((mx * size - x * 256 + m) / span * 65535), 0, 65535))
+        ys.append(np.clip(np.round((my * size - y * 256 + m) / span * 65535), 0, 65535))
+        pm = cols.num["pm25"][idx]
+        pms.append(np.where(np.isfinite(pm), np.clip(np.round(pm * POINT_PM_SCALE), 0, 65534), 65535))
+        seqs.append(cols.seq[idx])
+        devs.append(np.full(len(idx), i))
+    cat = lambda arrs, dt: np.concatenate(arrs).astype(dt) if arrs else np.zeros(0, dtype=dt)
+    header = {"z": z, "x": x, "y": y, "count": sum(len(a) for a in xs),
+              "devices": [dev for dev, _, _ in parts], "pm_scale": POINT_PM_SCALE, "margin_px": m}
+    return pack_arrays(POINT_TILE_MAGIC, header, [
+        ("x", cat(xs, "<u2")), ("y", cat(ys, "<u2")), ("pm25", cat(pms, "<u2")),
+        ("seq", cat(seqs, "<u4")), ("dev", cat(devs, "<u2"))], align=4)
+
+# ---- Columnar day data ----
+# /api/data?format=binary: b"HCOL", one array per COLUMNAR_TYPES field in response
+# order, aligned to 8; header "types" gives each dtype ("f8", "f4", "i4") and the
+# rest of the header is the usual /api/data metadata. device indexes header
+# "devices"; NaN = none. Header "envio_text" maps row index -> envio_n as sent
+# upstream, for the rows whose value the number does not round-trip (see
+# DayColumns). format=columnar sends the same columns as JSON lists.
+
+COLUMNAR_MAGIC = b"HCOL"
+COLUMNAR_TYPES = {
+    "epoch": "<f8", "seq": "<i4", "device": "<i4",
+    "envio_n": "<f8",          # counters outgrow float32's exact integers
+    "lat": "<f8", "lon": "<f8",  # float32 would round positions to ~1 m
+    **{f: "<f4" for f in NUM_FIELDS if f not in ("lat", "lon")},
+}
+
+def columnar_arrays(parts: List[Tuple[str, "DayColumns", np.ndarray]],
+                    order: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Columns of the rows in `parts` (device = part number), permuted by `order`; no row dicts."""
+    def cat(get) -> np.ndarray:
+        return np.concatenate([get(k, c, i) for k, (_, c, i) in enumerate(parts)]) if parts else np.zeros(0)
+    out = {"epoch": cat(lambda k, c, i: c.epoch[i]), "seq": cat(lambda k, c, i: c.seq[i]),
+           "device": cat(lambda k, c, i: np.full(len(i), k)),
+           "envio_n": cat(lambda k, c, i: envio_column(c, i))}
+    for f in NUM_FIELDS:
+        out[f] = cat(lambda k, c, i, f=f: c.num[f][i])
+    if order is not None:
+        out = {name: a[order] for name, a in out.items()}
+    return out
+
+def columnar_envio_text(parts: List[Tuple[str, "DayColumns", np.ndarray]],
+                        columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Original envio_n of the response rows that kept one in envio_text, by row index."""
+    out: Dict[str, Any] = {}
+    for k, (_, c, _) in enumerate(parts):
+        if not c.envio_text:
+            continue
+        rows = np.flatnonzero(columns["device"] == k)
+        for j, sq in zip(rows.tolist(), columns["seq"][rows].tolist()):
+            v = c.envio_text.get(sq)
+            if v is not None:
+                out[str(j)] = v
+    return out
+
+def columnar_response(fmt: str, meta: Dict[str,Any], columns: Dict[str, np.ndarray]) -> Response:
+    n = len(columns["epoch"])
+    if fmt == "binary":
+        header = {**meta, "count": n, "types": {name: dt[1:] for name, dt in COLUMNAR_TYPES.items()}}
+        data = pack_arrays(COLUMNAR_MAGIC, header,
+                           [(name, columns[name].astype(dt)) for name, dt in COLUMNAR_TYPES.items()])
+        return Response(data, mimetype="application/octet-stream")
+    cols: Dict[str, List[Any]] = {}
+    for name, dt in COLUMNAR_TYPES.items():
+        vals = columns[name].astype(np.float64 if dt[1] == "f" else np.int64).tolist()
+        cols[name] = [None if v != v else v for v in vals] if dt[1] == "f" else vals
+    return jsonify({**meta, "count": n, "columns": cols})
+
 # =========================
 # ===== COLLECTOR =========
 # =========================
 
-def collector_loop(key: Tuple[str,str,str], limit: int,
+# Upstream priorities: lower wins when tokens are scarce
+PRIO_INTERACTIVE = 0  # /api/data page mode, /download
+PRIO_HEAD = 1  # collector head sync / catch-up
+PRIO_BACKFILL = 2  # collector history backfill
+PRIO_NAMES = ["interactive", "head", "backfill"]
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    """Request shed locally by the limiter or the open circuit breaker."""
+
+class UpstreamGuard:
+    """
+    Token bucket + circuit breaker shared by every upstream call.
+    Waiters are served by priority (interactive > head > backfill). After
+    BREAKER_FAILURES consecutive failures the circuit opens and calls are shed
+    without touching upstream; after BREAKER_COOLDOWN_S a single half-open probe
+    decides whether to close it again.
+    """
+
+    def __init__(self, rate: float = UPSTREAM_RATE_PER_S, burst: int = UPSTREAM_BURST):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.waiting = [0] * len(PRIO_NAMES)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.stats: Dict[str, Any] = {
+            "granted": [0] * len(PRIO_NAMES), "shed": [0] * len(PRIO_NAMES),
+            "failures": 0, "opens": 0,
+        }
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _shed(self, priority: int, why: str) -> None:
+        self.stats["shed"][priority] += 1
+        raise UpstreamUnavailable(f"upstream {why}; {PRIO_NAMES[priority]} request shed")
+
+    def _check_breaker(self, priority: int) -> bool:
+        """Raise if the circuit rejects the call; True if it is the half-open probe."""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < BREAKER_COOLDOWN_S:
+                self._shed(priority, "circuit open")
+            self.state = "half_open"
+            self.probing = False
+            log("[upstream] circuit half-open; probing")
+        if self.state == "half_open":
+            if self.probing:
+                self._shed(priority, "circuit half-open")
+            self.probing = True
+            return True
+        return False
+
+    def acquire(self, priority: int) -> None:
+        """Block until a token is granted, or raise UpstreamUnavailable."""
+        deadline = time.monotonic() + INTERACTIVE_MAX_WAIT if priority == PRIO_INTERACTIVE else None
+        with self.cond:
+            if self.waiting[priority] >= UPSTREAM_MAX_QUEUE:
+                self._shed(priority, "queue full")
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    if self.state != "closed" and self._check_breaker(priority):
+                        break  # the half-open probe skips the bucket
+                    self._refill()
+                    if self.tokens >= 1 and not any(self.waiting[:priority]):
+                        self.tokens -= 1
+                        break
+                    wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.05
+                    if deadline is not None:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            self._shed(priority, "busy")
+                        wait = min(wait, left)
+                    self.cond.wait(wait)
+                self.stats["granted"][priority] += 1
+            finally:
+                self.waiting[priority] -= 1
+                self.cond.notify_all()
+
+    def record(self, ok: bool) -> None:
+        with self.cond:
+            if ok:
+                if self.state != "closed":
+                    log("[upstream] circuit closed")
+                self.state = "closed"
+                self.failures = 0
+            else:
+                self.stats["failures"] += 1
+                self.failures += 1
+                if self.state == "half_open" or (self.state == "closed" and self.failures >= BREAKER_FAILURES):
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+                    self.stats["opens"] += 1
+                    log(f"[upstream] circuit open after {self.failures} failure(s); cooling down {BREAKER_COOLDOWN_S:.0f}s")
+            self.probing = False
+            self.cond.notify_all()
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through (0 when closed)."""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, BREAKER_COOLDOWN_S - (time.monotonic() - self.opened_at))
+
+    def info(self) -> Dict[str, Any]:
+        with self.cond:
+            self._refill()
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_after_s": round(self.retry_after(), 1),
+                "tokens": round(self.tokens, 2),
+                "rate_per_s": self.rate,
+                "burst": self.burst,
+                "queued": dict(zip(PRIO_NAMES, self.waiting)),
+                "granted": dict(zip(PRIO_NAMES, self.stats["granted"])),
+                "shed": dict(zip(PRIO_NAMES, self.stats["shed"])),
+                "failures": self.stats["failures"],
+                "opens": self.stats["opens"],
+            }
+
+Guard = UpstreamGuard()
+
+def is_upstream_failure(e: Exception) -> bool:
+    """Errors that count against the breaker: network/timeouts, 429 and 5xx."""
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def iter_table_data(resp: requests.Response) -> Iterator[Dict[str,Any]]:
+    """
+    Yield the objects of data.tableData from a streamed JSON response one at a time.
+    Keys ahead of the array are walked by a small scanner and each element is
+    decoded with raw_decode, so only one chunk plus one partial element is held
+    in memory however large the page is. Yields nothing if there is no tableData.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = resp.iter_content(chunk_size=STREAM_CHUNK_BYTES)
+    buf, pos, eof = "", 0, False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buf = buf[pos:] + utf8.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        return True
+
+    def peek() -> Optional[str]:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                return None
+
+    # Walk to the '[' of {"data": {"tableData": [...]}}; stack holds [container, current key]
+    stack: List[List[Any]] = []
+    key_chars: Optional[List[str]] = None
+    last_str, escaped = None, False
+    while True:
+        if pos >= len(buf):
+            if not more():
+                return
+            continue
+        ch = buf[pos]
+        pos += 1
+        if key_chars is not None:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                last_str, key_chars = "".join(key_chars), None
+                continue
+            if len(key_chars) < 64:
+                key_chars.append(ch)
+        elif ch == '"':
+            key_chars = []
+        elif ch == ":":
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = last_str
+        elif ch == ",":
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = None
+        elif ch in "{[":
+            if (ch == "[" and len(stack) == 2 and stack[0] == ["{", "data"]
+                    and stack[1] == ["{", "tableData"]):
+                break
+            stack.append([ch, None])
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return
+
+    first = True
+    while True:
+        ch = peek()
+        if ch is None:
+            raise requests.exceptions.InvalidJSONError("truncated upstream JSON inside tableData")
+        if ch == "]":
+            break
+        if not first:
+            if ch != ",":
+                raise requests.exceptions.InvalidJSONError(f"unexpected {ch!r} between tableData rows")
+            pos += 1
+            if peek() is None:
+                raise requests.exceptions.InvalidJSONError("truncated upstream JSON inside tableData")
+        first = False
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    break
+            except ValueError as e:
+                if eof:
+                    raise requests.exceptions.InvalidJSONError(f"bad tableData row: {e}")
+            more()
+        pos = end
+        if isinstance(obj, dict):
+            yield obj
+    for _ in chunks:  # drain the tail so the pooled connection can be reused
+        pass
+
+def read_error_payload(resp: requests.Response) -> Dict[str,Any]:
+    """Parse a (small) non-2xx JSON body, reading at most ERROR_BODY_MAX bytes."""
+    body = b""
+    for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+        body += chunk
+        if len(body) >= ERROR_BODY_MAX:
+            return {}
+    try:
+        payload = json.loads(body.decode("utf-8", errors="replace"))
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+def fetch_upstream(session: requests.Session, url: str,
+                   consume: Callable[[Iterator[Dict[str,Any]]], Any],
                    connect_timeout=DEFAULT_CONNECT_TIMEOUT,
                    read_timeout=DEFAULT_READ_TIMEOUT,
-                   verify_tls=True):
+                   verify_tls=True,
+                   priority: int = PRIO_INTERACTIVE) -> Any:
+    """
+    GET one upstream page through Guard with a streamed body and return
+    consume(rows), rows being the tableData objects as they are parsed.
+    Returns None for the 400 'no hay registros' payload.
+    """
+    Guard.acquire(priority)
+    try:
+        with session.get(url, timeout=(connect_timeout, read_timeout), verify=verify_tls, stream=True) as resp:
+            if resp.status_code == 400 and is_no_records_payload(read_error_payload(resp)):
+                Guard.record(True)
+                return None
+            resp.raise_for_status()
+            result = consume(iter_table_data(resp))
+    except requests.exceptions.RequestException as e:
+        Guard.record(not is_upstream_failure(e))
+        raise
+    except Exception:
+        Guard.record(True)  # a bad body is not an outage
+        raise
+    Guard.record(True)
+    return result
+
+def fetch_raw_page(session: requests.Session, url: str,
+                   connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                   read_timeout=DEFAULT_READ_TIMEOUT,
+                   verify_tls=True,
+                   priority: int = PRIO_INTERACTIVE) -> Optional[List[Dict[str,Any]]]:
+    """GET one upstream page as raw rows. Returns None for the 400 'no hay registros' payload."""
+    return fetch_upstream(session, url, list, connect_timeout, read_timeout, verify_tls, priority)
+
+def convert_stream(rows: Iterator[Dict[str,Any]], sink: Callable[[List[Dict[str,Any]]], Any]) -> int:
+    """
+    Convert streamed raw rows STREAM_BATCH_ROWS at a time, passing each plotted
+    batch to `sink`, so at most one batch of raw rows is held. Returns raw rows seen.
+    """
+    n, batch = 0, []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= STREAM_BATCH_ROWS:
+            sink(process_raw_to_plotted(batch))
+            n += len(batch)
+            batch = []
+    if batch:
+        sink(process_raw_to_plotted(batch))
+    return n + len(batch)
+
+def fetch_plotted_page(session: requests.Session, url: str,
+                       connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                       read_timeout=DEFAULT_READ_TIMEOUT,
+                       verify_tls=True,
+                       priority: int = PRIO_INTERACTIVE) -> Optional[Tuple[int, List[Dict[str,Any]]]]:
+    """
+    GET one upstream page and convert it while it streams (see convert_stream).
+    Returns (raw rows seen, plotted rows), or None for the 400 'no hay registros' payload.
+    """
+    def consume(rows: Iterator[Dict[str,Any]]) -> Tuple[int, List[Dict[str,Any]]]:
+        plotted: List[Dict[str,Any]] = []
+        return convert_stream(rows, plotted.extend), plotted
+    return fetch_upstream(session, url, consume, connect_timeout, read_timeout, verify_tls, priority)
+
+class UpstreamClient:
+    """
+    Process-wide pooled session to the upstream API. Page-mode fetches go
+    through fetch(): concurrent identical URLs share one
+    in-flight GET (singleflight) and page-mode results are reused for
+    UPSTREAM_CACHE_TTL seconds, so a burst of Load/Older/Newer clicks costs one
+    upstream call. The cache is bounded by UPSTREAM_CACHE_MAX pages and
+    UPSTREAM_CACHE_MAX_ROWS rows; expired pages are dropped on every lookup.
+    Collectors and downloads use the same session but always fetch fresh pages.
+    """
+
+    def __init__(self, pool_maxsize: int = UPSTREAM_POOL_SIZE):
+        self.pool_maxsize = int(pool_maxsize)
+        self._session: Optional[requests.Session] = None
+        self.lock = threading.Lock()
+        self.inflight: Dict[str, Dict[str, Any]] = {}
+        self.cache: "OrderedDict[str, Tuple[float, Optional[List[Dict[str,Any]]]]]" = OrderedDict()
+        self.cached_rows = 0
+        self.stats: Dict[str, int] = {"requests": 0, "upstream": 0, "cache_hits": 0, "coalesced": 0, "errors": 0}
+
+    @property
+    def session(self) -> requests.Session:
+        with self.lock:
+            if self._session is None:
+                # No urllib3 retries: each guarded call is one upstream hit, and
+                # UpstreamGuard (limiter + breaker) owns backoff
+                self._session = make_session(retries=0, pool_maxsize=self.pool_maxsize)
+            return self._session
+
+    def _pop_oldest(self) -> None:
+        _, (_, rows) = self.cache.popitem(last=False)
+        self.cached_rows -= len(rows or ())
+
+    def _prune(self, now: float) -> None:
+        """Drop expired pages, then the oldest beyond the page/row limits. Lock held.
+        Pages stay in insertion (= timestamp) order, so expired ones are at the front."""
+        while self.cache and (now - next(iter(self.cache.values()))[0] >= UPSTREAM_CACHE_TTL
+                              or len(self.cache) > UPSTREAM_CACHE_MAX
+                              or self.cached_rows > UPSTREAM_CACHE_MAX_ROWS):
+            self._pop_oldest()
+
+    def fetch(self, url: str) -> Optional[List[Dict[str,Any]]]:
+        """fetch_raw_page through the TTL cache and singleflight. Callers must not mutate the rows."""
+        now = time.time()
+        with self.lock:
+            self.stats["requests"] += 1
+            self._prune(now)
+            hit = self.cache.get(url)
+            if hit is not None:
+                self.stats["cache_hits"] += 1
+                return hit[1]
+            flight = self.inflight.get(url)
+            leader = flight is None
+            if leader:
+                flight = {"done": threading.Event(), "rows": None, "error": None}
+                self.inflight[url] = flight
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["rows"]
+
+        try:
+            rows = fetch_raw_page(self.session, url)
+            flight["rows"] = rows
+            with self.lock:
+                self.stats["upstream"] += 1
+                if len(rows or ()) <= UPSTREAM_CACHE_MAX_ROWS:
+                    old = self.cache.pop(url, None)
+                    if old is not None:
+                        self.cached_rows -= len(old[1] or ())
+                    self.cache[url] = (time.time(), rows)
+                    self.cached_rows += len(rows or ())
+                    self._prune(time.time())
+            return rows
+        except Exception as e:
+            flight["error"] = e
+            with self.lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(url, None)
+            flight["done"].set()
+
+    def info(self) -> Dict[str, Any]:
+        with self.lock:
+            self._prune(time.time())
+            return {**self.stats, "cached_pages": len(self.cache), "cached_rows": self.cached_rows,
+                    "inflight": len(self.inflight),
+                    "pool_maxsize": self.pool_maxsize, "ttl_s": UPSTREAM_CACHE_TTL}
+
+Upstream = UpstreamClient()
+
+def device_room(project_id: str, device_code: str, tabla: str) -> str:
+    return f"dev:{project_id}:{device_code}:{tabla}"
+
+def all_devices_room(project_id: str, tabla: str) -> str:
+    return f"all:{project_id}:{tabla}"
+
+def emit_new_rows(key: Tuple[str,str,str], rows: List[Dict[str,Any]]) -> None:
+    """
+    Queue freshly stored rows for the device's room and its all-devices room.
+    The flusher sends at most one 'new_data' frame per room every EMIT_COALESCE_SECONDS.
+    """
+    if not rows:
+        return
+    if WorkerOutbox is not None:
+        notify_web("emit", key, rows)
+        return
     p, d, t = key
-    ensure_structs(key)
-    session = make_session()
-    stop = CollectorThreads[key]["stop"]
+    global EmitFlusherStarted
+    with EmitLock:
+        PendingEmits[device_room(p, d, t)].append((key, rows))
+        PendingEmits[all_devices_room(p, t)].append((key, rows))
+        if not EmitFlusherStarted:
+            EmitFlusherStarted = True
+            socketio.start_background_task(emit_flusher)
+
+def build_new_data_frame(room: str, batches: List[Tuple[Tuple[str,str,str], List[Dict[str,Any]]]]) -> Dict[str,Any]:
+    rows = [r for _, batch in batches for r in batch]
+    seqs: Dict[str, Dict[str,int]] = defaultdict(dict)
+    for r in rows:
+        dev, day = r.get("device_code") or "", str(r.get("time", ""))[:10]
+        seqs[dev][day] = max(seqs[dev].get(day, 0), int(r.get("seq") or 0))
+    p, d, t = batches[0][0]
+    return {
+        'key': {'project_id': p, 'device_code': d if room.startswith("dev:") else "", 'tabla': t},
+        'rows': rows,
+        'count': len(rows),
+        'days': sorted({str(r.get("time", ""))[:10] for r in rows}),
+        'seqs': seqs,
+    }
 
-    while not stop.is_set():
-        cur = Cursor[key]
+def emit_flusher() -> None:
+    while True:
+        socketio.sleep(EMIT_COALESCE_SECONDS)
+        with EmitLock:
+            pending = dict(PendingEmits)
+            PendingEmits.clear()
+        for room, batches in pending.items():
+            try:
+                socketio.emit('new_data', build_new_data_frame(room, batches), to=room, namespace='/')
+            except Exception as e:
+                log(f"[websocket] Error emitting to {room}: {e}")
+
+def collector_key(project_id: str, device_code: str, tabla: str) -> Tuple[str,str,str]:
+    """Key of the collector feeding `device_code`: the project feed in project mode."""
+    if COLLECTOR_MODE == "project":
+        return key_tuple(project_id, "", tabla)
+    return key_tuple(project_id, device_code, tabla)
+
+def raw_fingerprints(raw_rows: List[Dict[str,Any]], schema: Optional[RowSchema] = None) -> List[str]:
+    """time|envio_n of raw upstream rows, as row_fingerprint gives for their plotted rows."""
+    schema = schema or resolve_schema(raw_rows)
+    return [f"{tm}|{en}" for tm, en in zip(schema.column(raw_rows, "time"), schema.column(raw_rows, "envio"))]
+
+def head_known_index(key: Tuple[str,str,str], raw_rows: List[Dict[str,Any]],
+                     mark: Collection[str] = (), schema: Optional[RowSchema] = None) -> Optional[int]:
+    """
+    Index of the first row of a newest-first upstream page already seen for `key`:
+    in `mark` (the raw head watermark, which also covers rows conversion dropped)
+    or stored in DayFP. None if every row is new. For a project feed (empty device
+    code) each row is checked against its own device.
+    """
+    schema = schema or resolve_schema(raw_rows)
+    p, dev, t = key
+    devices = schema.column(raw_rows, "device") if not dev else [dev] * len(raw_rows)
+    with CacheLock:
+        for i, (tm, en, dv) in enumerate(zip(schema.column(raw_rows, "time"), schema.column(raw_rows, "envio"), devices)):
+            if f"{tm}|{en}" in mark:
+                return i
+            d = day_from_time(tm)
+            k = key_tuple(p, dv, t)
+            if not d or dv in (None, "") or d not in Days.get(k, ()):
+                continue
+            load_day_from_disk(k, d)
+            if f"{tm}|{en}" in DayFP[k][d]:
+                return i
+    return None
+
+def ingest_page(key: Tuple[str,str,str], raw_rows: List[Dict[str,Any]],
+                schema: Optional[RowSchema] = None) -> Tuple[Dict[str,int], Dict[Tuple[str,str,str], List[Dict[str,Any]]]]:
+    """Convert one upstream page and store it (see store_plotted)."""
+    return store_plotted(key, process_raw_to_plotted(raw_rows, schema))
+
+def store_plotted(key: Tuple[str,str,str], plotted: List[Dict[str,Any]]) -> Tuple[Dict[str,int], Dict[Tuple[str,str,str], List[Dict[str,Any]]]]:
+    """
+    Store converted rows. A project feed (empty device code) is demultiplexed by
+    codigo_interno into each device's day cache; devices seen for the first time
+    get registered in the catalog as their rows are stored.
+    Returns (added per day, stored rows per device key).
+    """
+    p, dev, t = key
+    if dev:
+        groups = {key: plotted}
+    else:
+        groups = defaultdict(list)
+        for r in plotted:
+            if r.get("device_code") not in (None, ""):
+                groups[key_tuple(p, r["device_code"], t)].append(r)
+    added: Dict[str,int] = defaultdict(int)
+    fresh: Dict[Tuple[str,str,str], List[Dict[str,Any]]] = {}
+    for k, rows in groups.items():
+        if not dev and k not in DayIndex:
+            with CacheLock:
+                ensure_catalog(p, t)
+                if k not in DayIndex:
+                    DayIndex[k] = {}
+                    log(f"[collector] discovered device {k[1]} in project feed {key}")
+        stored: List[Dict[str,Any]] = []
+        for day, n in add_to_day_cache(k, rows, stored).items():
+            added[day] += n
+        if stored:
+            fresh[k] = stored
+            notify_web("stored", k, stored)
+    return dict(added), fresh
+
+class CollectorEngine:
+    """
+    Runs every collector as an asyncio task on one event loop (in a daemon thread).
+    Upstream GETs go through one pooled requests.Session on a bounded executor,
+    so at most COLLECTOR_CONCURRENCY requests are in flight across all devices,
+    and idle collectors cost a pending asyncio.sleep instead of an OS thread.
+    """
+
+    def __init__(self, concurrency: int = COLLECTOR_CONCURRENCY):
+        self.concurrency = int(concurrency)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.session: Optional[requests.Session] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.sem: Optional[asyncio.Semaphore] = None
+        self.host_sems: Dict[str, asyncio.Semaphore] = {}
+        self.lock = threading.Lock()
+
+    def ensure_running(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.session = Upstream.session
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="collector-io")
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self._run, name="collector-engine", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.sem = asyncio.Semaphore(self.concurrency)
+        self.loop.run_forever()
+
+    def call(self, fn, *args) -> Any:
+        """Run `fn(*args)` on the engine loop from any thread and wait for the result."""
+        loop = self.ensure_running()
+        if threading.current_thread() is self.thread:
+            return fn(*args)
+        async def _wrap():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(_wrap(), loop).result()
+
+    def wait(self, coro_fn, *args) -> Any:
+        """Run the coroutine `coro_fn(*args)` on the engine loop and wait for it (not from the loop itself)."""
+        return asyncio.run_coroutine_threadsafe(coro_fn(*args), self.ensure_running()).result()
+
+    async def fetch(self, url: str, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                    read_timeout=DEFAULT_READ_TIMEOUT, verify_tls=True,
+                    priority: int = PRIO_HEAD, fetcher: Callable = fetch_raw_page) -> Any:
+        """Run `fetcher` (fetch_raw_page or fetch_plotted_page) under the concurrency caps."""
+        host = urlparse(url).netloc
+        if host not in self.host_sems:
+            self.host_sems[host] = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+        async with self.sem, self.host_sems[host]:
+            return await self.loop.run_in_executor(
+                self.executor, fetcher, self.session, url, connect_timeout, read_timeout, verify_tls, priority)
+
+    async def run_blocking(self, fn, *args) -> Any:
+        """
+        Conversion + cache writes run off-loop so one big page doesn't stall other tasks.
+        A cancelled caller still waits for the call to finish, so a stopped task is
+        done writing by the time it is.
+        """
+        fut = self.loop.run_in_executor(self.executor, fn, *args)
         try:
-            if not cur.get("finished", False):
-                offset = int(cur.get("offset", 0))
-                url = build_upstream_url(p, d, t, limit, offset)
-                resp = session.get(url, timeout=(connect_timeout, read_timeout), verify=verify_tls, stream=False)
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            await asyncio.wait({fut})
+            raise
 
-                payload = {}
-                try:
-                    payload = resp.json()
-                except Exception:
-                    pass
+Engine = CollectorEngine()
 
-                if resp.status_code == 400 and is_no_records_payload(payload):
-                    cur["finished"] = True
-                    cur["last_ok_ts"] = time.time()
-                    cur["last_error"] = None
-                    cur["last_url"] = url
-                    log(f"[collector] end (no records) {key}")
-                    time.sleep(HEAD_POLL_SECONDS)
-                    continue
+async def parallel_backfill(key: Tuple[str,str,str], limit: int,
+                            connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                            read_timeout=DEFAULT_READ_TIMEOUT,
+                            verify_tls=True) -> None:
+    """
+    Backfill history with BACKFILL_WORKERS workers claiming consecutive offset
+    ranges. Pages are merged into the day cache as they land, in any order;
+    Cursor["offset"] only advances over the contiguous prefix of finished pages,
+    so a crash or error resumes from the first page not yet stored.
+    Returns when the end of history is reached; re-raises the first fetch error.
+    """
+    p, d, t = key
+    cur = Cursor[key]
+    state: Dict[str, Any] = {"next": int(cur.get("offset", 0)), "end": None, "error": None}
+    done: Dict[int, int] = {}  # page offset -> rows received
+    inflight: set = set()
+
+    def advance() -> None:
+        off = int(cur.get("offset", 0))
+        while off in done and not cur.get("finished"):
+            n = done.pop(off)
+            cur["pages"] = int(cur.get("pages", 0)) + 1
+            cur["finished"] = (n < limit)
+            off += n
+        cur["offset"] = off
+        cur["backfill_inflight"] = sorted(inflight)
+        cur["backfill_ahead"] = sorted(done)
+
+    async def worker() -> None:
+        while state["error"] is None:
+            off = state["next"]
+            if state["end"] is not None and off >= state["end"]:
+                return
+            state["next"] = off + limit
+            url = build_upstream_url(p, d, t, limit, off)
+            inflight.add(off)
+            try:
+                page = await Engine.fetch(url, connect_timeout, read_timeout, verify_tls,
+                                          PRIO_BACKFILL, fetch_plotted_page)
+            except requests.exceptions.RequestException as e:
+                state["error"] = e
+                return
+            finally:
+                inflight.discard(off)
+            n, plotted = page if page is not None else (0, [])
+            added: Dict[str,int] = {}
+            if plotted:
+                added, _ = await Engine.run_blocking(store_plotted, key, plotted)
+            if n < limit:
+                state["end"] = off + n if state["end"] is None else min(state["end"], off + n)
+            done[off] = n
+            advance()
+            cur["last_ok_ts"] = time.time()
+            cur["last_error"] = None
+            cur["last_url"] = url
+            save_cursor(key)
+            if page is None:
+                log(f"[collector] end (no records) {key} offset={off}")
+            else:
+                log(f"[collector] page offset={off} got={n} plotted+={sum(added.values())} days+={list(added.keys())} frontier={cur['offset']}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, BACKFILL_WORKERS))))
+    cur["backfill_inflight"] = []
+    if state["error"] is not None:
+        raise state["error"]
+
+def schedule_poll(key: Tuple[str,str,str], stored: int) -> float:
+    """
+    Learn the device's arrival rate (EWMA of rows/s) from what a head sync stored
+    and return the next poll interval: about one expected row per poll while the
+    device is active, multiplied by POLL_BACKOFF after every empty poll, clamped to
+    [POLL_MIN_SECONDS, POLL_MAX_SECONDS]. State is kept in Cursor[key]["poll"].
+    """
+    now = time.time()
+    st = Cursor[key].setdefault("poll", {
+        "interval_s": float(HEAD_POLL_SECONDS), "rate_per_s": None,
+        "last_poll_ts": None, "last_data_ts": None, "next_due_ts": None,
+    })
+    elapsed = (now - st["last_poll_ts"]) if st["last_poll_ts"] else None
+    interval = st["interval_s"]
+    if stored > 0:
+        if elapsed:
+            sample = stored / max(elapsed, 1e-3)
+            rate = st["rate_per_s"]
+            st["rate_per_s"] = sample if rate is None else POLL_RATE_ALPHA * sample + (1 - POLL_RATE_ALPHA) * rate
+            interval = 1.0 / st["rate_per_s"]
+        st["last_data_ts"] = now
+    else:
+        if elapsed and st["rate_per_s"] is not None:
+            st["rate_per_s"] *= (1 - POLL_RATE_ALPHA)
+        interval *= POLL_BACKOFF
+    st["interval_s"] = min(POLL_MAX_SECONDS, max(POLL_MIN_SECONDS, interval))
+    st["last_poll_ts"] = now
+    st["next_due_ts"] = now + st["interval_s"]
+    return st["interval_s"]
+
+async def head_sync(key: Tuple[str,str,str], limit: int,
+                    connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                    read_timeout=DEFAULT_READ_TIMEOUT,
+                    verify_tls=True) -> int:
+    """
+    Incremental head sync: fetch the newest HEAD_PROBE_ROWS rows, keep doubling the
+    window (up to `limit`) only while every row is new, and stop at the first row
+    already seen (see head_known_index). Only the rows ahead of it are converted
+    and stored; the newest raw rows become the next head_mark.
+    Returns how far older upstream offsets shifted: the new raw rows when a head
+    mark bounded the walk, else only the stored rows (rows conversion drops may be
+    old ones, and counting them would skip history).
+    """
+    p, d, t = key
+    cur = Cursor[key]
+    mark = set(cur.get("head_mark") or ())
+    offset, window = 0, max(1, min(HEAD_PROBE_ROWS, limit))
+    new_raw = stored = pages = 0
+    newest: List[str] = []
+    while pages < MAX_PAGES_SAFE:
+        url = build_upstream_url(p, d, t, window, offset)
+        raw_rows = await Engine.fetch(url, connect_timeout, read_timeout, verify_tls)
+        pages += 1
+        cur["last_ok_ts"] = time.time()
+        cur["last_error"] = None
+        cur["last_url"] = url
+        if not raw_rows:
+            break
+        schema = resolve_schema(raw_rows)  # once per page, passed down
+        if offset == 0:
+            newest = await Engine.run_blocking(raw_fingerprints, raw_rows[:HEAD_PROBE_ROWS], schema)
+        known = await Engine.run_blocking(head_known_index, key, raw_rows, mark, schema)
+        head = raw_rows if known is None else raw_rows[:known]
+        if head:
+            added, fresh = await Engine.run_blocking(ingest_page, key, head, schema)
+            stored += sum(added.values())
+            for k, rows in fresh.items():
+                emit_new_rows(k, rows)
+        new_raw += len(head)
+        if known is not None or len(raw_rows) < window:
+            break
+        offset += len(raw_rows)
+        window = min(window * 2, limit)
+    if newest:
+        cur["head_mark"] = newest
+    shifted = new_raw if mark else stored
+    cur["head_sync"] = {"pages": pages, "rows_fetched": offset + (len(raw_rows) if raw_rows else 0),
+                        "new_rows": shifted, "stored": stored, "ts": time.time()}
+    return shifted
+
+async def repair_gaps(key: Tuple[str,str,str], limit: int,
+                      connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                      read_timeout=DEFAULT_READ_TIMEOUT,
+                      verify_tls=True) -> Dict[str,Any]:
+    """
+    Re-fetch only the upstream pages around a device's pending envio_n gaps.
+    Each gap's offset is estimated from the cached rows newer than it (plus the
+    still-missing rows newer than it); the window is re-aimed up to GAP_MAX_PROBES
+    times if it lands too new/old. Gaps still open afterwards are marked
+    unrecoverable, so they are not fetched again. Cost scales with the gaps.
+    """
+    p, d, t = key
+    gaps = await Engine.run_blocking(scan_gaps, key)
+    todo = [(day, r) for day, g in gaps.items() for r in g["ranges"]
+            if [r[0], r[1]] not in g["unrecoverable"]]
+    todo.sort(key=lambda x: -x[1][3])  # newest first, like upstream offsets
+    stats = {"gaps": len(todo), "missing": sum(r[1] - r[0] + 1 for _, r in todo),
+             "requests": 0, "fetched": 0, "stored": 0, "unrecoverable": 0}
+    missing_newer = 0
+    for day, (lo, hi, ta, tb) in todo:
+        n_missing = hi - lo + 1
+        size = max(1, min(limit, n_missing + 2 * GAP_FETCH_SLACK))
+        off = max(0, await Engine.run_blocking(rows_newer_than, key, tb) + missing_newer - GAP_FETCH_SLACK)
+        probes = stored = 0
+        while probes < GAP_MAX_PROBES + n_missing // size:
+            raw_rows = await Engine.fetch(build_upstream_url(p, d, t, size, off),
+                                          connect_timeout, read_timeout, verify_tls, PRIO_BACKFILL)
+            probes += 1
+            stats["requests"] += 1
+            if not raw_rows:
+                break
+            stats["fetched"] += len(raw_rows)
+            schema = resolve_schema(raw_rows)
+            added, _ = await Engine.run_blocking(ingest_page, key, raw_rows, schema)
+            stored += sum(added.values())
+            epochs = [e for e in map(time_to_epoch, schema.column(raw_rows, "time")) if e is not None]
+            if not epochs:
+                break
+            if max(epochs) < tb and off > 0:
+                off = max(0, off - size + GAP_FETCH_SLACK)  # overshot: all older than the gap
+            elif min(epochs) > ta and len(raw_rows) == size:
+                off += size - GAP_FETCH_SLACK  # not old enough yet
+            else:
+                break
+        stats["stored"] += stored
+        missing_newer += max(0, n_missing - stored)  # rows now cached count in rows_newer_than
+    after = await Engine.run_blocking(scan_gaps, key)
+    for day, g in after.items():
+        still = [[lo, hi] for lo, hi, _, _ in g["ranges"]
+                 if [lo, hi] not in g["unrecoverable"] and any(r[0] <= hi and lo <= r[1] for dd, r in todo if dd == day)]
+        if still:
+            await Engine.run_blocking(mark_unrecoverable, key, day, still)
+            stats["unrecoverable"] += sum(hi - lo + 1 for lo, hi in still)
+    stats["ts"] = time.time()
+    Cursor[key]["gap_repair"] = stats
+    if todo:
+        log(f"[gaps] {key}: {stats['gaps']} gap(s), {stats['missing']} missing envio_n; "
+            f"{stats['requests']} request(s), {stats['fetched']} rows fetched, +{stats['stored']} stored, "
+            f"{stats['unrecoverable']} unrecoverable")
+    return stats
+
+async def repair_collector_gaps(key: Tuple[str,str,str], limit: int, *args) -> None:
+    """Gap repair for the devices fed by a collector (all catalog devices for a project feed)."""
+    p, d, t = key
+    devices = [d] if d else await Engine.run_blocking(catalog_devices, p, t)
+    for dv in devices:
+        await repair_gaps(key_tuple(p, dv, t), limit, *args)
+
+async def collector_task(key: Tuple[str,str,str], limit: int,
+                         connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                         read_timeout=DEFAULT_READ_TIMEOUT,
+                         verify_tls=True):
+    p, d, t = key
+    ensure_structs(key)
+    # Register cached days of every device first: head sync stops at known rows
+    await Engine.run_blocking(ensure_catalog, p, t)
+
+    # Resuming from a checkpoint: sync the head up to the newest stored row
+    # instead of re-crawling history. Rows found there shift the backfill offset.
+    cur = Cursor[key]
+    cur["catchup"] = bool(cur.get("finished") or int(cur.get("offset", 0)) > 0)
 
-                resp.raise_for_status()
-                if not payload:
-                    payload = resp.json()
-
-                raw_rows = extract_rows(payload)
-                n = len(raw_rows)
-                plotted = process_raw_to_plotted(raw_rows)
-                added = add_to_day_cache(key, plotted)
-
-                cur["offset"] = offset + n
-                cur["pages"] = int(cur.get("pages", 0)) + 1
-                cur["finished"] = (n < limit)
-                cur["last_ok_ts"] = time.time()
-                cur["last_error"] = None
-                cur["last_url"] = url
-                log(f"[collector] page#{cur['pages']} offset={offset} got={n} plotted+={sum(added.values())} days+={list(added.keys())}")
-                time.sleep(0.2 if not cur["finished"] else HEAD_POLL_SECONDS)
+    while True:
+        cur = Cursor[key]
+        try:
+            if cur.get("catchup"):
+                new = await head_sync(key, limit, connect_timeout, read_timeout, verify_tls)
+                if new and not cur.get("finished", False):
+                    cur["offset"] = int(cur.get("offset", 0)) + new
+                cur["catchup"] = False
+                resume = "head polling" if cur.get("finished") else f"backfill at offset {cur['offset']}"
+                log(f"[collector] caught up {key}: +{new} rows in {cur['head_sync']['pages']} head page(s); resuming {resume}")
+                save_cursor(key)
+                await asyncio.sleep(0.2)
                 continue
 
-            # Head polling
-            url = build_upstream_url(p, d, t, limit, 0)
-            resp = session.get(url, timeout=(connect_timeout, read_timeout), verify=verify_tls, stream=False)
-            payload = {}
-            try:
-                payload = resp.json()
-            except Exception:
-                resp.raise_for_status()
-            if resp.status_code == 400 and is_no_records_payload(payload):
-                time.sleep(HEAD_POLL_SECONDS)
+            if not cur.get("finished", False):
+                await parallel_backfill(key, limit, connect_timeout, read_timeout, verify_tls)
+                await asyncio.sleep(0.2 if not cur.get("finished") else HEAD_POLL_SECONDS)
                 continue
 
-            resp.raise_for_status()
-            raw_rows = extract_rows(payload)
-            plotted = process_raw_to_plotted(raw_rows)
-            added = add_to_day_cache(key, plotted)
-            if sum(added.values()) > 0:
-                log(f"[collector] head append +{sum(added.values())} rows days+={list(added.keys())}")
-                try:
-                    socketio.emit('new_data', {
-                        'key': {'project_id': p, 'device_code': d, 'tabla': t},
-                        'rows': plotted,
-                        'count': sum(added.values()),
-                        'days': list(added.keys())
-                    }, namespace='/')
-                except Exception as e:
-                    log(f"[websocket] Error emitting: {e}")
-            time.sleep(HEAD_POLL_SECONDS)
+            # Head polling, at the device's adaptive interval
+            mark = cur.get("head_mark")
+            new = await head_sync(key, limit, connect_timeout, read_timeout, verify_tls)
+            delay = schedule_poll(key, cur["head_sync"]["stored"])
+            if new:
+                log(f"[collector] head append +{cur['head_sync']['stored']} rows ({new} upstream) in {cur['head_sync']['pages']} page(s); next poll in {delay:.0f}s")
+            if new or cur.get("head_mark") != mark:
+                save_cursor(key)
+            if GAP_SCAN_SECONDS and time.time() - cur.get("gap_scan_ts", 0) >= GAP_SCAN_SECONDS:
+                cur["gap_scan_ts"] = time.time()
+                await repair_collector_gaps(key, limit, connect_timeout, read_timeout, verify_tls)
+            await asyncio.sleep(delay)
 
         except requests.exceptions.RequestException as e:
+            delay = max(5.0, Guard.retry_after())
+            if "poll" in Cursor[key]:
+                Cursor[key]["poll"]["next_due_ts"] = time.time() + delay
             Cursor[key]["last_error"] = f"{type(e).__name__}: {e}"
-            log(f"[collector] error {Cursor[key]['last_error']}; sleep 5s")
-            time.sleep(5.0)
+            log(f"[collector] error {Cursor[key]['last_error']}; sleep {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+def _collector_done(key: Tuple[str,str,str], task: "asyncio.Task") -> None:
+    if CollectorTasks.get(key, {}).get("task") is task:
+        CollectorTasks.pop(key, None)
+    if task.cancelled():
+        log(f"[collector] stopped {key}")
+    elif task.exception() is not None:
+        Cursor[key]["last_error"] = f"{type(task.exception()).__name__}: {task.exception()}"
+        log(f"[collector] crashed {key}: {Cursor[key]['last_error']}")
+
+def _start_task(key: Tuple[str,str,str], limit: int) -> bool:
+    info = CollectorTasks.get(key)
+    if info and not info["task"].done():
+        return False
+    task = Engine.loop.create_task(collector_task(key, limit))
+    task.add_done_callback(lambda tk: _collector_done(key, tk))
+    CollectorTasks[key] = {"task": task, "limit": limit, "started": time.time()}
+    return True
+
+def _stop_task(key: Tuple[str,str,str]) -> Optional[Dict[str,Any]]:
+    """Cancel the task of `key`; returns its CollectorTasks entry (None if none ran)."""
+    info = CollectorTasks.pop(key, None)
+    if info:
+        info["task"].cancel()
+    return info
+
+async def _stop_task_wait(key: Tuple[str,str,str]) -> Optional[Dict[str,Any]]:
+    """_stop_task, then wait until the task (and any cache write it had running) is finished."""
+    info = _stop_task(key)
+    if info:
+        await asyncio.wait({info["task"]})
+    return info
 
 def start_collector(project_id: str, device_code: str, tabla: str, limit: int, reset=False):
-    key = key_tuple(project_id, device_code, tabla)
+    """
+    Ensure the collector feeding `device_code` runs (the project feed in project mode).
+    reset=True first purges the cache as purge_cache does (in project mode: one
+    device's rows and a feed rewind, or every device for device_code="").
+    """
+    if COLLECTOR_PROCESS:
+        Worker.send("start", project_id, device_code, tabla, int(limit), reset)
+        return
+    key = collector_key(project_id, device_code, tabla)
     ensure_structs(key)
     if reset:
         purge_cache(project_id, device_code, tabla, keep_structs=True)
-    if key in CollectorThreads and CollectorThreads[key]["thread"].is_alive():
-        return
-    stop_evt = threading.Event()
-    th = threading.Thread(target=collector_loop, args=(key, int(limit)), daemon=True)
-    CollectorThreads[key] = {"thread": th, "stop": stop_evt}
-    th.start()
-    log(f"[collector] started {key} with limit={limit}")
-
-def stop_collector(project_id: str, device_code: str, tabla: str):
-    key = key_tuple(project_id, device_code, tabla)
-    info = CollectorThreads.get(key)
-    if not info: return
-    info["stop"].set()
-    log(f"[collector] stop requested {key}")
+    if Engine.call(_start_task, key, int(limit)):
+        log(f"[collector] started {key} with limit={limit}")
 
-def purge_cache(project_id: str, device_code: str, tabla: str, keep_structs=False):
+def stop_collector(project_id: str, device_code: str, tabla: str, wait=False) -> Optional[Dict[str,Any]]:
+    """
+    Cancel the collector feeding `device_code` (the project feed in project mode);
+    wait=True also waits until it is done writing. Returns the stopped task's entry.
+    """
+    key = collector_key(project_id, device_code, tabla)
+    if COLLECTOR_PROCESS:
+        Worker.send("stop", project_id, device_code, tabla)
+        return None
+    if Engine.loop is None:
+        return None
+    info = Engine.wait(_stop_task_wait, key) if wait else Engine.call(_stop_task, key)
+    if info:
+        log(f"[collector] stop requested {key}")
+    return info
+
+def start_gap_repair(project_id: str, device_code: str, tabla: str, limit: int) -> None:
+    """Run repair_gaps for one device on the engine loop (in the worker if there is one)."""
+    if COLLECTOR_PROCESS:
+        Worker.send("repair", project_id, device_code, tabla, int(limit))
+        return
     key = key_tuple(project_id, device_code, tabla)
-    stop_collector(project_id, device_code, tabla)
-    if not keep_structs:
-        Days.pop(key, None)
-        DayRows.pop(key, None)
-        DayFP.pop(key, None)
-        Cursor.pop(key, None)
-    else:
-        Days[key].clear()
-        DayRows[key].clear()
-        DayFP[key].clear()
-        Cursor[key] = {"offset": 0, "pages": 0, "finished": False, "last_ok_ts": None, "last_error": None, "last_url": ""}
+    loop = Engine.ensure_running()
+    asyncio.run_coroutine_threadsafe(repair_gaps(key, int(limit)), loop)
+    log(f"[gaps] repair requested for {key}")
+
+def drop_cached_key(key: Tuple[str,str,str], keep_structs=False) -> None:
+    """Forget everything held in memory for `key` (days, fingerprints, index, cursor)."""
+    with CacheLock:
+        forget_days(key)
+        DayIndex.pop(key, None)
+        if not keep_structs:
+            Days.pop(key, None)
+            DayRows.pop(key, None)
+            DayFP.pop(key, None)
+            Cursor.pop(key, None)
+        else:
+            Days[key].clear()
+            DayRows[key].clear()
+            DayFP[key].clear()
+            Cursor[key] = default_cursor()
 
+def purge_key(key: Tuple[str,str,str], keep_structs=False) -> None:
+    """Drop one key's memory, folder and heat tiles (its collector must be stopped)."""
+    p, d, t = key
+    drop_cached_key(key, keep_structs)
     folder = cache_dir(key)
     try:
         shutil.rmtree(folder)
     except Exception:
         pass
     os.makedirs(folder, exist_ok=True)
+    for devset in (d, ""):
+        shutil.rmtree(heat_tile_dir(p, t, devset), ignore_errors=True)
+    notify_web("purged", key, keep_structs)
     log(f"[admin] purged cache {key}")
 
+def purge_cache(project_id: str, device_code: str, tabla: str, keep_structs=False):
+    """
+    Stop the collector writing `device_code` and drop its cache. In project mode the
+    feed writes every device: purging the feed (device_code="") purges all of them,
+    and purging one device rewinds the feed (drops its cursor, restarting it if it
+    ran) so that device's history is fetched again; other devices' rows dedupe.
+    """
+    if COLLECTOR_PROCESS:
+        # The worker owns the files; it drops them, then tells us to drop memory
+        Worker.send("purge", project_id, device_code, tabla, keep_structs)
+        return
+    key = key_tuple(project_id, device_code, tabla)
+    feed = collector_key(project_id, device_code, tabla)
+    # Wait for the task: a page it is still storing would recreate the files below
+    stopped = stop_collector(project_id, device_code, tabla, wait=True)
+    if feed != key:
+        purge_key(key, keep_structs)
+        purge_key(feed, keep_structs=True)
+        if stopped and Engine.call(_start_task, feed, stopped["limit"]):
+            log(f"[collector] restarted {feed} from offset 0 for {device_code}")
+        return
+    if COLLECTOR_MODE == "project":
+        for device in catalog_devices(project_id, tabla):
+            purge_key(key_tuple(project_id, device, tabla), keep_structs)
+    purge_key(key, keep_structs)
+
 def scan_and_load_all_devices(project_id: str, tabla: str) -> List[str]:
-    """Scan cache directory and load all days for all devices found."""
+    """Scan cache directory, register the days of all devices found and build the day catalog.
+    Rows are not loaded here; they load lazily on first access."""
     if not os.path.exists(CACHE_ROOT):
         return []
 
     prefix = f"{project_id}_"
     suffix = f"_{tabla}"
     devices_found = []
+    CatalogScanned.add((str(project_id), str(tabla)))
 
     for dirname in os.listdir(CACHE_ROOT):
         if dirname.startswith(prefix) and dirname.endswith(suffix):
@@ -537,34 +2714,201 @@ def scan_and_load_all_devices(project_id: str, tabla: str) -> List[str]:
             ensure_structs(key)
             folder = cache_dir(key)
 
-            # Load all days from disk for this device
-            days_loaded = []
+            # Register days only; rows are loaded on first access and LRU-evicted
+            days_found = []
             if os.path.exists(folder):
                 for name in os.listdir(folder):
                     if name.endswith(".jsonl") and len(name) >= 10:
                         day = name[:10]
+                        day_summary(key, day)
                         if day not in Days[key]:
                             Days[key].append(day)
-                            days_loaded.append(day)
-                        # Pre-load the day data into memory
-                        load_day_from_disk(key, day)
+                            days_found.append(day)
 
                 Days[key] = sorted(Days[key])
-                if days_loaded:
-                    log(f"[startup] Loaded {len(days_loaded)} days for device {device}: {sorted(days_loaded)}")
+                if days_found:
+                    log(f"[startup] Found {len(days_found)} days for device {device}")
 
     if devices_found:
-        log(f"[startup] Found and loaded {len(devices_found)} devices: {devices_found}")
+        log(f"[startup] Found {len(devices_found)} devices: {devices_found}")
 
     return devices_found
 
 def start_collectors_for_all_devices(project_id: str, tabla: str, limit: int):
-    """Start collectors for all known devices."""
+    """Start collectors for all known devices (the single project feed in project mode)."""
     devices = scan_and_load_all_devices(project_id, tabla)
+    if COLLECTOR_MODE == "project":
+        start_collector(project_id, "", tabla, limit, reset=False)
+        return devices
     for device in devices:
         start_collector(project_id, device, tabla, limit, reset=False)
     return devices
 
+# ---- Worker process ----
+#
+# With COLLECTOR_PROCESS=True the engine above runs in a spawned child, so page
+# parsing and conversion no longer hold the web process's GIL. The day files
+# (.jsonl appended, sidecars/cursor written atomically) are the shared store:
+# only the worker writes them. The web process keeps its own day cache, folds in
+# the rows the worker reports, and emits 'new_data' as before.
+#
+#   web -> worker: ("start", p, d, t, limit, reset) | ("stop", p, d, t) | ("purge", p, d, t, keep)
+#   worker -> web: ("stored", key, rows) | ("emit", key, rows) | ("purged", key, keep)
+#                  | ("cursors", {key: cursor}) | ("log", line)
+
+def worker_settings() -> Dict[str, Any]:
+    """Plain config values of this process, re-applied in the spawned worker."""
+    return {k: v for k, v in globals().items()
+            if k.isupper() and isinstance(v, (str, int, float, bool)) and k != "COLLECTOR_PROCESS"}
+
+def collector_worker_main(inbox: "multiprocessing.Queue", outbox: "multiprocessing.Queue",
+                          settings: Dict[str, Any]) -> None:
+    """Entry point of the collector worker process."""
+    global WorkerOutbox
+    globals().update(settings)
+    WorkerOutbox = outbox
+    log(f"[worker] collector worker started (pid {os.getpid()})")
+
+    def send_cursors() -> None:
+        while True:
+            time.sleep(WORKER_STATUS_SECONDS)
+            with CacheLock:
+                snap = {k: json.loads(json.dumps(Cursor[k], default=str)) for k in list(Cursor)}
+            notify_web("cursors", snap)
+
+    threading.Thread(target=send_cursors, name="worker-status", daemon=True).start()
+    while True:
+        msg = inbox.get()
+        if msg is None:
+            return
+        op, args = msg[0], msg[1:]
+        try:
+            if op == "start":
+                start_collector(*args)
+            elif op == "stop":
+                stop_collector(*args)
+            elif op == "purge":
+                purge_cache(*args)
+            elif op == "repair":
+                start_gap_repair(*args)
+        except Exception as e:
+            log(f"[worker] {op}{args} failed: {type(e).__name__}: {e}")
+
+def apply_stored_rows(key: Tuple[str,str,str], rows: List[Dict[str,Any]]) -> None:
+    """
+    Web side: fold rows the worker already wrote to disk into memory. Loaded days
+    read their .jsonl on from where the last read stopped, so rows are appended in
+    line order (and `seq` matches) even if the day was loaded mid-write; day
+    summaries are re-read from the worker's sidecars.
+    """
+    global ChangeSeq
+    ensure_structs(key)
+    by_day: Dict[str, List[Dict[str,Any]]] = defaultdict(list)
+    for r in rows:
+        d = stored_day(r)
+        if d:
+            by_day[d].append(r)
+    with CacheLock:
+        for d, day_rows in by_day.items():
+            DayIndex[key].pop(d, None)
+            day_summary(key, d)
+            cols = DayRows[key].get(d)
+            if cols is not None:
+                lines, cols.file_pos = read_day_lines(os.path.join(cache_dir(key), f"{d}.jsonl"), cols.file_pos)
+                cols.append(unseen_rows(lines, DayFP[key][d]))
+                touch_day(key, d)
+            invalidate_heat_tiles(key, d, day_rows)
+        ChangeSeq += len(rows)
+        Days[key] = sorted(set(Days[key]) | set(by_day))
+        evict_days()
+
+def handle_worker_message(msg: Tuple[Any, ...]) -> None:
+    op = msg[0]
+    if op == "stored":
+        apply_stored_rows(msg[1], msg[2])
+    elif op == "emit":
+        emit_new_rows(msg[1], msg[2])
+    elif op == "purged":
+        drop_cached_key(msg[1], msg[2])
+    elif op == "cursors":
+        with CacheLock:
+            for k, cur in msg[1].items():
+                Cursor[k] = cur
+    elif op == "log":
+        Logs.append(msg[1])  # already printed by the worker (shared stdout)
+
+class CollectorWorker:
+    """
+    Web-process handle on the collector worker: starts it on first use, relays
+    commands, applies its messages on a listener thread, and respawns it (replaying
+    the collectors it was running) if it dies.
+    Note: the worker has its own UpstreamGuard; interactive requests keep this one.
+    """
+
+    def __init__(self):
+        self.proc: Optional[multiprocessing.Process] = None
+        self.inbox: Optional["multiprocessing.Queue"] = None
+        self.started: Dict[Tuple[str,str,str], Tuple[Any, ...]] = {}
+        self.lock = threading.Lock()
+        self.stats = {"spawns": 0, "sent": 0, "received": 0}
+
+    def ensure_running(self) -> None:
+        with self.lock:
+            if self.proc is not None and self.proc.is_alive():
+                return
+            ctx = multiprocessing.get_context("spawn")
+            self.inbox, outbox = ctx.Queue(), ctx.Queue()
+            self.proc = ctx.Process(target=collector_worker_main, args=(self.inbox, outbox, worker_settings()),
+                                    name="hiri-collector", daemon=True)
+            self.proc.start()
+            self.stats["spawns"] += 1
+            # A real thread, not socketio.start_background_task: under eventlet that is a
+            # greenlet, and the blocking outbox.get() would stall the whole hub
+            threading.Thread(target=self._listen, args=(self.proc, outbox),
+                             name="worker-listener", daemon=True).start()
+            for args in self.started.values():
+                self.inbox.put(("start",) + args[:4] + (False,))
+        log(f"[worker] spawned collector worker pid {self.proc.pid}")
+
+    def send(self, op: str, *args: Any) -> None:
+        key = key_tuple(*args[:3])
+        with self.lock:
+            if op == "start":
+                self.started[key] = args
+            elif op in ("stop", "purge"):
+                self.started.pop(key, None)
+        self.ensure_running()
+        self.inbox.put((op,) + args)
+        self.stats["sent"] += 1
+
+    def _listen(self, proc: multiprocessing.Process, outbox: "multiprocessing.Queue") -> None:
+        while True:
+            try:
+                msg = outbox.get(timeout=1.0)
+            except queue.Empty:
+                if proc.is_alive():
+                    continue
+                if proc is self.proc:
+                    log(f"[worker] collector worker exited (code {proc.exitcode}); respawning")
+                    self.ensure_running()
+                return
+            self.stats["received"] += 1
+            try:
+                handle_worker_message(msg)
+            except Exception as e:
+                log(f"[worker] bad message {msg[0]!r}: {type(e).__name__}: {e}")
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "enabled": COLLECTOR_PROCESS,
+            "pid": self.proc.pid if self.proc is not None else None,
+            "alive": bool(self.proc is not None and self.proc.is_alive()),
+            "collectors": [list(k) for k in self.started],
+            **self.stats,
+        }
+
+Worker = CollectorWorker()
+
 # =========================
 # ====== FLASK ROUTES =====
 # =========================
@@ -581,8 +2925,8 @@ def map_view():
     device_code = request.args.get("device_code", "")  # Empty by default to show all devices
     tabla = request.args.get("tabla", DEFAULT_TABLA)
 
-    # Only start collector if device_code is specified
-    if device_code:
+    # Only start collector if device_code is specified (any view feeds the project collector)
+    if device_code or COLLECTOR_MODE == "project":
         start_collector(project_id, device_code, tabla, DEFAULT_LIMIT, reset=False)
 
     # Create Folium map with plugins
@@ -602,6 +2946,9 @@ def map_view():
         "tabla": tabla,
         "palette": {"breaks": PM_BREAKS, "colors": PM_COLORS},
         "exports_base": "/download",
+        "viewport_min_rows": VIEWPORT_MIN_ROWS,
+        "cluster_max_zoom": CLUSTER_MAX_ZOOM,
+        "heat_max_zoom": HEAT_MAX_ZOOM,
     }
 
     # Add external CSS
@@ -732,46 +3079,98 @@ def api_day_index():
     d = request.args.get("device_code")
 
     if not d:
-        all_days = set()
+        per_day: Dict[str, List[Dict[str,Any]]] = defaultdict(list)
         last_cursor = {}
-        prefix = f"{p}_"
-        suffix = f"_{t}"
-        for dirname in os.listdir(CACHE_ROOT):
-            if dirname.startswith(prefix) and dirname.endswith(suffix):
-                device = dirname[len(prefix):-len(suffix)]
+        polling = {}
+        devices = catalog_devices(p, t)
+        with CacheLock:
+            for device in devices:
                 key = key_tuple(p, device, t)
-                ensure_structs(key)
-                folder = cache_dir(key)
-                log(f"[day-index] Scanning folder (no device): {folder}")
-                for name in os.listdir(folder):
-                    if name.endswith(".jsonl") and len(name) >= 10:
-                        day = name[:10]
-                        if day not in Days[key]:
-                            Days[key].append(day)
-                        all_days.add(day)
-                Days[key] = sorted(Days[key])
+                for day, summary in DayIndex[key].items():
+                    per_day[day].append(summary)
                 last_cursor = Cursor.get(key, {})
-        log(f"[day-index] Total days (all devices): {len(all_days)} - {sorted(all_days)}")
+                if "poll" in last_cursor:
+                    polling[device] = last_cursor["poll"]
+            if COLLECTOR_MODE == "project":
+                # One feed polls every device: each reports the feed's schedule
+                last_cursor = Cursor.get(collector_key(p, "", t), {})
+                if "poll" in last_cursor:
+                    polling = {device: last_cursor["poll"] for device in devices}
+            stats = {day: public_summary(merge_summaries(ss)) for day, ss in per_day.items()}
         return jsonify({
-            "days": sorted(all_days),
-            "cursor": last_cursor
+            "days": sorted(per_day),
+            "stats": stats,
+            "devices": devices,
+            "cursor": last_cursor,
+            "polling": polling,
+            "change": ChangeSeq
         })
     else:
         key = key_tuple(p, d, t)
+        ensure_catalog(p, t)
         ensure_structs(key)
-        folder = cache_dir(key)
-        log(f"[day-index] Scanning folder for device {d}: {folder}")
-        days_found = []
-        for name in os.listdir(folder):
-            if name.endswith(".jsonl") and len(name) >= 10:
-                day = name[:10]
-                days_found.append(day)
-                if day not in Days[key]:
-                    Days[key].append(day)
-        Days[key] = sorted(Days[key])
-        cur = Cursor.get(key, {})
-        log(f"[day-index] Found {len(days_found)} days on disk: {sorted(days_found)}, returning {len(Days[key])} days: {Days[key]}")
-        return jsonify({"days": Days[key], "cursor": cur})
+        with CacheLock:
+            days = sorted(DayIndex[key])
+            stats = {day: public_summary(DayIndex[key][day]) for day in days}
+            cur = Cursor.get(collector_key(p, d, t), {})
+        return jsonify({"days": days, "stats": stats, "cursor": cur, "change": ChangeSeq})
+
+def parse_after_seq(value: Optional[str], device_code: Optional[str]) -> Optional[Dict[str,int]]:
+    """
+    after_seq is either a plain number (applies to the requested device, or to
+    every device in aggregated mode) or "DEV-A:120,DEV-B:55". Missing devices
+    default to 0, i.e. their whole day.
+    """
+    if value is None or value == "":
+        return None
+    out: Dict[str,int] = {}
+    for part in str(value).split(","):
+        dev, sep, num = part.rpartition(":")
+        try:
+            n = int(num)
+        except ValueError:
+            continue
+        out[dev if sep else (device_code or "*")] = n
+    return out
+
+def parse_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """bbox=west,south,east,north (Leaflet's toBBoxString order) -> (south, west, north, east)."""
+    if not value:
+        return None
+    parts = [float(x) for x in value.split(",")]
+    if len(parts) != 4 or not all(math.isfinite(x) for x in parts):
+        raise ValueError("bbox must be west,south,east,north")
+    west, south, east, north = parts
+    if south > north or west > east:
+        raise ValueError("bbox must be west,south,east,north")
+    return south, west, north, east
+
+def thin_viewport(parts: List[Tuple[str, "DayColumns", np.ndarray]], zoom: Optional[int],
+                  budget: int) -> List[Tuple[str, "DayColumns", np.ndarray]]:
+    """
+    Reduce viewport rows to what the map can show: at `zoom`, keep only the newest
+    row per screen pixel (256 px tiles), then stride-sample every device
+    proportionally down to `budget` rows in total. Positions stay time-ordered.
+    """
+    if zoom is not None:
+        px = 360.0 / (256 * 2 ** max(0, min(zoom, 24)))
+        thinned = []
+        for dev, cols, idx in parts:
+            ci = np.floor(cols.num["lat"][idx] / px).astype(np.int64)
+            cj = np.floor(cols.num["lon"][idx] / px).astype(np.int64)
+            cell = ci * 4_000_000_000 + cj
+            _, last = np.unique(cell[::-1], return_index=True)
+            keep = np.sort(len(idx) - 1 - last)
+            thinned.append((dev, cols, idx[keep]))
+        parts = thinned
+    total = sum(len(i) for _, _, i in parts)
+    if total <= budget:
+        return parts
+    out = []
+    for dev, cols, idx in parts:
+        k = max(1, int(budget * len(idx) / total))
+        out.append((dev, cols, idx[np.linspace(0, len(idx) - 1, k).astype(np.int64)]))
+    return out
 
 @app.route("/api/data")
 def api_data():
@@ -792,74 +3191,208 @@ def api_data():
             try:
                 if not s: return 0.0
                 if s.isdigit():
-                    return float(s)
-                return datetime.fromisoformat(s.replace("Z","")).timestamp()
+                    return unix_to_epoch(float(s))
+                return time_to_epoch(s) or 0.0
             except Exception:
                 return 0.0
 
-        rows: List[Dict[str,Any]] = []
-        if not d:
-            prefix = f"{p}_"
-            suffix = f"_{t}"
-            for dirname in os.listdir(CACHE_ROOT):
-                if dirname.startswith(prefix) and dirname.endswith(suffix):
-                    device = dirname[len(prefix):-len(suffix)]
-                    dkey = key_tuple(p, device, t)
-                    load_day_from_disk(dkey, day)
-                    day_rows = DayRows[dkey].get(day, [])
-                    for r in day_rows:
-                        if "device_code" not in r:
-                            r = dict(r)
-                            r["device_code"] = device
-                        rows.append(r)
-        else:
-            load_day_from_disk(key, day)
-            rows = DayRows[key].get(day, [])
-
-        if since:
-            th = to_epoch(since)
-            filtered = []
-            for r in rows:
-                ts = r.get("time")
-                if not ts:
-                    continue
-                try:
-                    te = datetime.fromisoformat(str(ts).replace("Z","")).timestamp()
-                except Exception:
-                    continue
-                if te > th:
-                    filtered.append(r)
-            rows = filtered
-
+        fmt = request.args.get("format", "rows")
+        if fmt not in ("rows", "columnar", "binary"):
+            return jsonify({"status":"fail","error":"format must be rows, columnar or binary"}), 400
+        devices = catalog_devices(p, t) if not d else [d]
+        after = parse_after_seq(request.args.get("after_seq"), d)
         try:
-            rows.sort(key=lambda x: x.get("time") or "")
-        except Exception:
-            pass
-        return jsonify({"status":"success","type":"plotted","rows":rows, "aggregated": (not d), "day": day, "since": since})
+            bbox = parse_bbox(request.args.get("bbox"))
+            zoom = int(request.args["zoom"]) if request.args.get("zoom") else None
+            budget = min(VIEW_POINT_BUDGET, int(request.args.get("max_points", VIEW_POINT_BUDGET)))
+        except ValueError as e:
+            return jsonify({"status":"fail","error":f"bad viewport: {e}"}), 400
+
+        th = to_epoch(since) if since else None
+        parts: List[Tuple[str, DayColumns, np.ndarray]] = []
+        seqs: Dict[str,int] = {}
+        reset: List[str] = []
+        with CacheLock:
+            for device in devices:
+                dkey = key_tuple(p, device, t)
+                load_day_from_disk(dkey, day)
+                cols = DayRows[dkey].get(day)
+                if cols is None or len(cols) == 0:
+                    continue
+                seqs[device] = cols.last_seq
+                if after is not None:
+                    a = after.get(device, after.get("*", 0))
+                    if a > cols.last_seq:
+                        # Client is ahead of us (cache was purged/rebuilt): resend the day
+                        reset.append(device)
+                        a = 0
+                    idx = cols.after_seq_index(a)
+                elif th is not None:
+                    idx = cols.tail_index(th)
+                else:
+                    idx = np.arange(len(cols))
+                if bbox is not None and len(idx):
+                    inside = cols.bbox_index(*bbox)
+                    idx = np.intersect1d(idx, inside) if after is None else idx[np.isin(idx, inside)]
+                if len(idx):
+                    parts.append((device, cols, idx))
+            if bbox is not None:
+                view = {"bbox": [bbox[1], bbox[0], bbox[3], bbox[2]], "zoom": zoom,
+                        "in_view": sum(len(i) for _, _, i in parts)}
+                parts = thin_viewport(parts, zoom, budget)
+                view["returned"] = sum(len(i) for _, _, i in parts)
+                view["truncated"] = view["returned"] < view["in_view"]
+
+            # Each device is already time-ordered; only the all-devices view needs a merge.
+            # Delta (after_seq) responses stay in arrival order.
+            order = None
+            if len(parts) > 1 and after is None:
+                epochs = np.concatenate([c.epoch[i] for _, c, i in parts])
+                order = np.argsort(epochs, kind="stable")
+            if fmt == "rows":
+                per_part = [c.to_dicts(i, default_device=dev) for dev, c, i in parts]
+            else:
+                columns = columnar_arrays(parts, order)
+                envio_text = columnar_envio_text(parts, columns)
+            change = ChangeSeq
+        if fmt != "rows":
+            meta = {"status":"success","type":"plotted","format":fmt, "aggregated": (not d), "day": day,
+                    "since": since, "seqs": seqs, "reset": reset, "change": change,
+                    "devices": [dev for dev, _, _ in parts], "envio_text": envio_text}
+            if bbox is not None:
+                meta["view"] = view
+            return columnar_response(fmt, meta, columns)
+        if order is not None:
+            flat = [r for part in per_part for r in part]
+            rows = [flat[i] for i in order.tolist()]
+        else:
+            rows = [r for part in per_part for r in part]
+        out = {"status":"success","type":"plotted","rows":rows, "aggregated": (not d), "day": day, "since": since,
+               "seqs": seqs, "reset": reset, "change": change}
+        if bbox is not None:
+            out["view"] = view
+        return jsonify(out)
 
     # Page mode
     limite = int(request.args.get("limite", DEFAULT_LIMIT))
     offset = int(request.args.get("offset", 0))
     url = build_upstream_url(p,d,t,limite,offset)
-    s = make_session()
     try:
-        r = s.get(url, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), verify=True, stream=False)
-        payload = {}
-        try:
-            payload = r.json()
-        except Exception:
-            pass
-        if r.status_code == 400 and is_no_records_payload(payload):
+        raw = Upstream.fetch(url)
+        if raw is None:
             return jsonify({"status":"success","type":"plotted","rows":[],"meta":{"note":"no records"}})
-        r.raise_for_status()
-        if not payload:
-            payload = r.json()
-        raw = extract_rows(payload)
         plotted = process_raw_to_plotted(raw)
         return jsonify({"status":"success","type":"plotted","rows":plotted})
+    except UpstreamUnavailable as e:
+        return jsonify({"status":"fail","error":str(e), "url":url, "retry_after": Guard.retry_after()}), 503
     except requests.exceptions.RequestException as e:
         return jsonify({"status":"fail","error":f"{type(e).__name__}: {e}", "url":url}), 502
 
+@app.route("/api/clusters")
+def api_clusters():
+    """
+    Clusters of one day for ?zoom= (and optionally bbox=west,south,east,north):
+    centroid, count, mean/max PM2.5. Every device of the project when device_code is empty.
+    `seqs` are the per-device day sequence numbers, as in /api/data, for live deltas.
+    """
+    p = request.args.get("project_id", DEFAULT_PROJECT_ID)
+    d = request.args.get("device_code")
+    t = request.args.get("tabla", DEFAULT_TABLA)
+    day = request.args.get("day")
+    if not day:
+        return jsonify({"status":"fail","error":"day required"}), 400
+    try:
+        zoom = int(request.args.get("zoom", 0))
+        bbox = parse_bbox(request.args.get("bbox"))
+    except ValueError as e:
+        return jsonify({"status":"fail","error":f"bad viewport: {e}"}), 400
+    devices = catalog_devices(p, t) if not d else [d]
+    indexes = []
+    seqs: Dict[str,int] = {}
+    with CacheLock:
+        for device in devices:
+            dkey = key_tuple(p, device, t)
+            load_day_from_disk(dkey, day)
+            cols = DayRows[dkey].get(day)
+            if cols is not None and len(cols):
+                indexes.append(cols.cluster_index())
+                seqs[device] = cols.last_seq
+                touch_day(dkey, day)
+        clusters = query_clusters(indexes, zoom, bbox)
+        change = ChangeSeq
+    return jsonify({"status":"success", "day": day, "zoom": min(zoom, CLUSTER_MAX_ZOOM), "aggregated": (not d),
+                    "clusters": clusters, "points": sum(c["count"] for c in clusters), "seqs": seqs, "change": change})
+
+@app.route("/tiles/heat/<day>/<int:z>/<int:x>/<int:y>.png")
+def heat_tile(day: str, z: int, x: int, y: int):
+    """PM2.5 heat tile of one day (all devices of the project when device_code is empty)."""
+    p = request.args.get("project_id", DEFAULT_PROJECT_ID)
+    d = request.args.get("device_code", "")
+    t = request.args.get("tabla", DEFAULT_TABLA)
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", day) or not 0 <= z <= HEAT_MAX_ZOOM \
+            or not (0 <= x < (1 << z) and 0 <= y < (1 << z)) \
+            or not all(safe_path_part(v) for v in (p, d, t)) or not p or not t:
+        return jsonify({"status":"fail","error":"bad tile"}), 400
+    try:
+        path, png = heat_tile_png(p, d, t, day, z, x, y)
+    except ValueError:
+        return jsonify({"status":"fail","error":"bad tile"}), 400
+    if path is None:
+        return Response(png, mimetype="image/png", headers={"Cache-Control": "no-cache"})
+    # Revalidated by ETag on every use: appends delete tiles server-side
+    return send_file(path, mimetype="image/png", max_age=0, conditional=True)
+
+@app.route("/tiles/points/<day>/<int:z>/<int:x>/<int:y>.bin")
+def point_tile(day: str, z: int, x: int, y: int):
+    """Binary point tile of one day (see BINARY RESPONSES), thinned like a zoom=z viewport query."""
+    p = request.args.get("project_id", DEFAULT_PROJECT_ID)
+    d = request.args.get("device_code")
+    t = request.args.get("tabla", DEFAULT_TABLA)
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", day) or not 0 <= z <= 24 \
+            or not (0 <= x < (1 << z) and 0 <= y < (1 << z)) \
+            or not all(safe_path_part(v) for v in (p, d or "", t)):
+        return jsonify({"status":"fail","error":"bad tile"}), 400
+    devices = catalog_devices(p, t) if not d else [d]
+    bounds = tile_bounds(z, x, y, POINT_TILE_MARGIN_PX)
+    parts = []
+    with CacheLock:
+        for device in devices:
+            dkey = key_tuple(p, device, t)
+            load_day_from_disk(dkey, day)
+            cols = DayRows[dkey].get(day)
+            if cols is None or len(cols) == 0:
+                continue
+            idx = cols.bbox_index(*bounds)
+            if len(idx):
+                parts.append((device, cols, idx))
+            touch_day(dkey, day)
+        parts = thin_viewport(parts, z, VIEW_POINT_BUDGET)
+        data = encode_point_tile(parts, z, x, y)
+    return Response(data, mimetype="application/octet-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route("/api/point")
+def api_point():
+    """One stored row by (device_code, day, seq): the popup of a point-tile point."""
+    p = request.args.get("project_id", DEFAULT_PROJECT_ID)
+    d = request.args.get("device_code", "")
+    t = request.args.get("tabla", DEFAULT_TABLA)
+    day = request.args.get("day", "")
+    try:
+        seq = int(request.args.get("seq", ""))
+    except ValueError:
+        return jsonify({"status":"fail","error":"seq required"}), 400
+    key = key_tuple(p, d, t)
+    with CacheLock:
+        if d and day in Days.get(key, ()):
+            load_day_from_disk(key, day)
+        cols = DayRows[key].get(day) if key in DayRows else None
+        if cols is None:
+            return jsonify({"status":"fail","error":"unknown device/day"}), 404
+        if not 1 <= seq <= cols.last_seq:
+            return jsonify({"status":"fail","error":"unknown seq"}), 404
+        row = cols.to_dicts(cols.seq_pos[seq - 1:seq], default_device=d)[0]
+    return jsonify({"status":"success", "row": row})
+
 # ---- Downloads ----
 
 def df_from_rows(rows: List[Dict[str,Any]]) -> pd.DataFrame:
@@ -877,30 +3410,29 @@ def download(kind: str, ext: str):
     offset = int(request.args.get("offset", 0))
     paginate = request.args.get("paginate","0") == "1";
 
+    # Pages are streamed straight into rows_all (converted in batches for plotted),
+    # so no page is ever held twice; download pages bypass the page cache.
     rows_all: List[Dict[str,Any]] = []
-    s = make_session()
+    def consume(rows: Iterator[Dict[str,Any]]) -> int:
+        if kind == "plotted":
+            return convert_stream(rows, rows_all.extend)
+        before = len(rows_all)
+        rows_all.extend(rows)
+        return len(rows_all) - before
+
     pages = 0
     cur_offset = offset
     while True:
         url = build_upstream_url(p,d,t,limite,cur_offset)
-        r = s.get(url, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), verify=True, stream=False)
-        payload = {}
         try:
-            payload = r.json()
-        except Exception:
-            pass
-        if r.status_code == 400 and is_no_records_payload(payload):
+            n = fetch_upstream(Upstream.session, url, consume)
+        except UpstreamUnavailable as e:
+            return Response(f"Upstream unavailable: {e}", status=503,
+                            headers={"Retry-After": str(int(Guard.retry_after()) or 1)})
+        if n is None:
             break
-        r.raise_for_status()
-        if not payload:
-            payload = r.json()
-        raw = extract_rows(payload)
-        if kind == "raw":
-            rows_all.extend(raw)
-        else:
-            rows_all.extend(process_raw_to_plotted(raw))
         pages += 1
-        if not paginate or len(raw) < limite or pages >= MAX_PAGES_SAFE:
+        if not paginate or n < limite or pages >= MAX_PAGES_SAFE:
             break
         cur_offset += limite
 
@@ -939,12 +3471,75 @@ def admin_purge():
     purge_cache(p,d,t, keep_structs=False)
     return jsonify({"ok": True, "message": f"purged cache for {(p,d,t)}"})
 
+@app.route("/admin/gaps")
+def admin_gaps():
+    """Missing envio_n ranges per cached day of a device; repair=1 re-fetches them in the background."""
+    p = request.args.get("project_id", DEFAULT_PROJECT_ID)
+    d = request.args.get("device_code", DEFAULT_DEVICE_CODE)
+    t = request.args.get("tabla", DEFAULT_TABLA)
+    key = key_tuple(p, d, t)
+    ensure_catalog(p, t)
+    ensure_structs(key)
+    gaps = scan_gaps(key, save=not COLLECTOR_PROCESS)
+    if request.args.get("repair", "0") == "1":
+        start_gap_repair(p, d, t, int(request.args.get("limit", DEFAULT_LIMIT)))
+    return jsonify({
+        "device_code": d,
+        "missing": sum(g["missing"] for g in gaps.values()),
+        "pending": sum(g["pending"] for g in gaps.values()),
+        "last_repair": Cursor.get(key, {}).get("gap_repair"),
+        "days": {day: {k: g[k] for k in ("missing", "pending", "resets", "unrecoverable")}
+                 | {"ranges": [{"from": lo, "to": hi, "after": epoch_to_time(ta), "before": epoch_to_time(tb)}
+                               for lo, hi, ta, tb in g["ranges"]]}
+                 for day, g in gaps.items() if g["ranges"] or g["resets"]},
+    })
+
 @app.route("/admin/logs")
 def admin_logs():
     tail = int(request.args.get("tail", 200))
     lines = list(Logs)[-tail:]
     return jsonify({"lines": lines})
 
+@app.route("/admin/cache-stats")
+def admin_cache_stats():
+    global DAY_CACHE_BUDGET_MB
+    budget = request.args.get("budget_mb")
+    with SchemaLock:
+        schemas = {
+            **SchemaStats,
+            "signatures": len(SchemaCache),
+            "entries": [sc.stats() for sc in reversed(SchemaCache.values())],
+        }
+    with CacheLock:
+        if budget:
+            DAY_CACHE_BUDGET_MB = float(budget)
+            evict_days()
+        used = sum(DayLRU.values())
+        lookups = CacheStats["hits"] + CacheStats["misses"]
+        loaded = [{"device_code": k[1], "day": d, "rows": len(DayRows[k][d]), "bytes": nb}
+                  for (k, d), nb in reversed(DayLRU.items())]
+        return jsonify({
+            "budget_bytes": int(DAY_CACHE_BUDGET_MB * 1024 * 1024),
+            "used_bytes": used,
+            "days_loaded": len(DayLRU),
+            **CacheStats,
+            "hit_ratio": (CacheStats["hits"] / lookups) if lookups else None,
+            "loaded": loaded,
+            "upstream": Upstream.info(),
+            "heat_tiles": dict(HeatStats),
+            "schemas": schemas,
+        })
+
+@app.route("/admin/upstream")
+def admin_upstream():
+    """Limiter/breaker state, queued and shed requests per priority, client cache counters."""
+    return jsonify({"guard": Guard.info(), "client": Upstream.info()})
+
+@app.route("/admin/worker")
+def admin_worker():
+    """Collector worker process: pid, liveness, collectors it runs, message counters."""
+    return jsonify(Worker.info())
+
 @app.route("/healthz")
 def healthz():
     return jsonify({"ok": True})
@@ -1204,15 +3799,35 @@ def handle_connect():
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    Subscriptions.pop(request.sid, None)
     log(f"[websocket] Client disconnected: {request.sid}")
 
 @socketio.on('subscribe')
 def handle_subscribe(data):
-    project_id = data.get('project_id')
-    device_code = data.get('device_code')
-    tabla = data.get('tabla')
-    log(f"[websocket] Client {request.sid} subscribed to {project_id}/{device_code}/{tabla}")
-    emit('subscribed', {'project_id': project_id, 'device_code': device_code, 'tabla': tabla})
+    data = data or {}
+    project_id = str(data.get('project_id') or DEFAULT_PROJECT_ID)
+    device_code = str(data.get('device_code') or "")
+    tabla = str(data.get('tabla') or DEFAULT_TABLA)
+    room = device_room(project_id, device_code, tabla) if device_code else all_devices_room(project_id, tabla)
+    if device_code or COLLECTOR_MODE == "project":
+        start_collector(project_id, device_code, tabla, DEFAULT_LIMIT, reset=False)
+
+    # One subscription per client: re-subscribing (e.g. on Apply) leaves the previous room
+    old = Subscriptions.get(request.sid)
+    if old and old != room:
+        leave_room(old)
+    join_room(room)
+    Subscriptions[request.sid] = room
+    log(f"[websocket] Client {request.sid} subscribed to {room}")
+    emit('subscribed', {'project_id': project_id, 'device_code': device_code, 'tabla': tabla, 'room': room})
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data=None):
+    room = Subscriptions.pop(request.sid, None)
+    if room:
+        leave_room(room)
+        log(f"[websocket] Client {request.sid} unsubscribed from {room}")
+    emit('unsubscribed', {'room': room})
 
 # =========================
 # ========= MAIN ==========
@@ -1225,7 +3840,7 @@ if __name__ == "__main__":
     log("[startup] Scanning cache for all devices...")
     devices = start_collectors_for_all_devices(DEFAULT_PROJECT_ID, DEFAULT_TABLA, DEFAULT_LIMIT)
 
-    if not devices:
+    if not devices and COLLECTOR_MODE != "project":
         # If no devices found in cache, start default collector
         log(f"[startup] No devices found in cache, starting default collector for {DEFAULT_DEVICE_CODE}")
         start_collector(DEFAULT_PROJECT_ID, DEFAULT_DEVICE_CODE, DEFAULT_TABLA, DEFAULT_LIMIT, reset=False)